@@ -0,0 +1,258 @@
+"""Vectorised evaluation of one MazeBot program across many mazes.
+
+Usage:
+    import batch
+    result = batch.evaluate(code_str, maps)
+    result.reached_goal  # one entry per map
+
+All robots run the program in lock-step on a stacked NumPy copy of the grids.
+Branch-free programs keep every robot on the same path through the code; when
+a sensor splits the robots, each side of the branch runs with a mask of the
+robots that took it. Steps, key pickup, doors and crashes follow
+main.RobotSim, so each maze's outcome matches simulate_program.
+
+Requires NumPy.
+"""
+import ast
+import numpy as np
+import main
+
+class BatchResult:
+    """Per-maze outcomes of a batch run, as arrays indexed like the input maps"""
+    def __init__(self, reached_goal, steps, crashed, crash_pos, final_pos, final_dir, halted, error):
+        self.reached_goal = reached_goal  # Ended on the goal without a runtime error
+        self.steps = steps                # Steps used, counted like main.RobotSim
+        self.crashed = crashed            # Hit a wall or a locked door
+        self.crash_pos = crash_pos        # (x, y) of the blocked cell, (-1, -1) if no crash
+        self.final_pos = final_pos        # (x, y) after the program ends
+        self.final_dir = final_dir        # 0=N, 1=E, 2=S, 3=W
+        self.halted = halted              # Stopped by the step budget or the call depth limit
+        self.error = error                # Per-maze runtime error message or None
+
+    def __len__(self):
+        return len(self.steps)
+
+    def outcomes(self):
+        """(reached_goal, steps, crash_pos or None) for every maze"""
+        for i in range(len(self)):
+            crash = tuple(int(v) for v in self.crash_pos[i]) if self.crashed[i] else None
+            yield bool(self.reached_goal[i]), int(self.steps[i]), crash
+
+
+class BatchRunner:
+    """Runs a validated program tree over all robots at once
+
+    Every statement takes the mask of robots that reach it and returns the
+    mask of robots that carry on after it. Robots leaving through break,
+    continue or return are parked in the enclosing loop or call until it ends;
+    crashed and halted robots drop out of alive and never come back.
+    """
+    def __init__(self, tree, maps, step_budget):
+        n = len(maps)
+        size = max(game_map.stride for game_map in maps)  # Maps come with one cell of wall padding
+        walls = np.ones((n, size, size), dtype=bool)
+        keys = np.zeros((n, size, size), dtype=bool)
+        doors = np.zeros((n, size, size), dtype=bool)
+        for i, game_map in enumerate(maps):
+            stride = game_map.stride
+            cells = np.frombuffer(game_map.cells, dtype=np.uint8).reshape(stride, stride)
+            walls[i, :stride, :stride] = cells == main.CELL_WALL
+            for x, y in game_map.keys:
+                keys[i, y + 1, x + 1] = True
+            for x, y in game_map.doors:
+                doors[i, y + 1, x + 1] = True
+        # Cells are addressed by their index into the flattened stack, so a move is one addition
+        self.size = size
+        self.walls, self.keys, self.doors = walls.ravel(), keys.ravel(), doors.ravel()
+        self.has_items = bool(keys.any() or doors.any())
+        self.offsets = np.array([dy * size + dx for dx, dy in main.DIRECTION_VECTORS])
+        self.base = np.arange(n) * size * size
+        starts = [game_map.start_pos for game_map in maps]
+        self.pos = self.base + np.array([(y + 1) * size + x + 1 for x, y in starts], dtype=np.int64)
+        self.direction = np.ones(n, dtype=np.int64)
+        self.keys_held = np.zeros(n, dtype=np.int64)
+        self.steps = np.zeros(n, dtype=np.int64)
+        self.ticks = 0  # Upper bound on any robot's steps
+        self.step_budget = step_budget
+        self.alive = np.ones(n, dtype=bool)
+        self.crashed = np.zeros(n, dtype=bool)
+        self.crash_cell = np.zeros(n, dtype=np.int64)
+        self.error = [None] * n
+        self.functions = {stmt.name: stmt for stmt in tree.body if isinstance(stmt, ast.FunctionDef)}
+        self.loops = []  # [break mask, continue mask] of the enclosing loops
+        self.calls = []  # Return mask of the enclosing calls
+        self.tree = tree
+
+    def run(self):
+        self.block(self.tree.body, self.alive.copy())
+
+    def none(self):
+        return np.zeros(len(self.alive), dtype=bool)
+
+    def stop(self, mask, message):
+        self.alive &= ~mask
+        for i in np.flatnonzero(mask):
+            self.error[i] = message
+
+    def tick(self, mask):
+        """Charge one step to every robot in mask; returns the robots still within budget"""
+        self.steps += mask
+        self.ticks += 1
+        if self.ticks > self.step_budget:
+            over = mask & (self.steps > self.step_budget)
+            if over.any():
+                self.stop(over, f"Step limit exceeded ({self.step_budget} steps)")
+                return mask & self.alive
+        return mask
+
+    def block(self, body, mask):
+        for stmt in body:
+            mask = mask & self.alive
+            if not mask.any():
+                break
+            mask = self.statement(stmt, mask)
+        return mask
+
+    def statement(self, node, mask):
+        if isinstance(node, ast.Expr):
+            if isinstance(node.value, ast.Call):
+                return self.call(node.value, mask)
+            return mask  # Docstrings and bare constants
+        if isinstance(node, ast.For):
+            return self.for_loop(node, mask)
+        if isinstance(node, ast.While):
+            return self.while_loop(node, mask)
+        if isinstance(node, ast.If):
+            taken = self.condition(node.test, mask)
+            mask = mask & self.alive
+            return self.block(node.body, mask & taken) | self.block(node.orelse, mask & ~taken)
+        if isinstance(node, ast.Break):
+            self.loops[-1][0] |= mask
+            return self.none()
+        if isinstance(node, ast.Continue):
+            self.loops[-1][1] |= mask
+            return self.none()
+        if isinstance(node, ast.Return):
+            self.calls[-1] |= mask
+            return self.none()
+        return mask  # pass, and function definitions (hoisted)
+
+    def call(self, node, mask):
+        name = node.func.id
+        if name == 'move':
+            self.move(mask)
+        elif name == 'turn_left':
+            self.turn(mask, 3)
+        elif name == 'turn_right':
+            self.turn(mask, 1)
+        elif name in main.ProgramCompiler.SENSORS:
+            self.tick(mask)
+        elif name in self.functions:
+            mask = self.tick(mask)
+            if len(self.calls) >= main.SIM_CALL_DEPTH:
+                self.stop(mask, "maximum recursion depth exceeded")
+                return self.none()
+            self.calls.append(self.none())
+            mask = self.block(self.functions[name].body, mask)
+            mask |= self.calls.pop()
+        return mask & self.alive  # print() does not change the outcome
+
+    def for_loop(self, node, mask):
+        count = len(range(*[main.ProgramCompiler().constant(arg) for arg in node.iter.args]))
+        self.loops.append([self.none(), self.none()])
+        for _ in range(count):
+            mask = self.tick(mask)
+            if not mask.any():
+                break
+            mask = self.block(node.body, mask) | self.loops[-1][1]
+            self.loops[-1][1] = self.none()
+        breaks = self.loops.pop()[0]
+        return (mask | breaks) & self.alive
+
+    def while_loop(self, node, mask):
+        self.loops.append([self.none(), self.none()])
+        done = self.none()
+        while True:
+            mask = self.tick(mask)
+            taken = self.condition(node.test, mask)
+            mask = mask & self.alive
+            done |= mask & ~taken
+            mask &= taken
+            if not mask.any():
+                break
+            mask = self.block(node.body, mask) | self.loops[-1][1]
+            self.loops[-1][1] = self.none()
+        breaks = self.loops.pop()[0]
+        return (done | breaks) & self.alive
+
+    def condition(self, node, mask):
+        """Truth value of node for the robots in mask, short-circuiting like Python"""
+        if isinstance(node, ast.UnaryOp):
+            return ~self.condition(node.operand, mask)
+        if isinstance(node, ast.BoolOp):
+            is_or = isinstance(node.op, ast.Or)
+            value = self.condition(node.values[0], mask)
+            for operand in node.values[1:]:
+                pending = mask & self.alive & (~value if is_or else value)
+                if not pending.any():
+                    break
+                value = np.where(pending, self.condition(operand, pending), value)
+            return value
+        if isinstance(node, ast.Constant):
+            return np.full(len(mask), bool(node.value))
+        turn, reads_open = main.ProgramCompiler.SENSORS[node.func.id]
+        self.tick(mask)
+        wall = self.walls[self.pos + self.offsets[(self.direction + turn) & 3]]
+        return ~wall if reads_open else wall
+
+    def turn(self, mask, turn):
+        mask = self.tick(mask)
+        self.direction = (self.direction + turn * mask) & 3
+
+    def move(self, mask):
+        mask = self.tick(mask)
+        target = self.pos + self.offsets[self.direction]
+        blocked = mask & self.walls[target]
+        if self.has_items:
+            # Key pickup comes first, then a door needs a key
+            key = mask & self.keys[target]
+            if key.any():
+                self.keys[target[key]] = False
+                self.keys_held += key
+            door = mask & self.doors[target]
+            if door.any():
+                locked = door & (self.keys_held == 0)
+                opened = door & ~locked
+                self.doors[target[opened]] = False
+                self.keys_held -= opened
+                blocked |= locked
+        if blocked.any():
+            self.crashed |= blocked
+            self.crash_cell[blocked] = target[blocked]
+            self.alive &= ~blocked
+            mask = mask & ~blocked
+        self.pos = np.where(mask, target, self.pos)
+
+    def cells(self, pos):
+        local = pos - self.base
+        return np.stack([local % self.size - 1, local // self.size - 1], axis=1)
+
+    def result(self, maps):
+        final_pos = self.cells(self.pos)
+        goal = np.array([game_map.goal_pos for game_map in maps]).reshape(-1, 2)
+        halted = np.array([error is not None for error in self.error], dtype=bool)
+        reached_goal = (final_pos == goal).all(axis=1) & ~halted
+        crash_pos = np.where(self.crashed[:, None], self.cells(self.crash_cell), -1)
+        return BatchResult(reached_goal, self.steps.copy(), self.crashed.copy(), crash_pos,
+                           final_pos, self.direction.copy(), halted, self.error)
+
+
+def evaluate(code_str, maps, step_budget=main.SIM_STEP_BUDGET):
+    """Run code_str on every map in maps and return a BatchResult (raises SyntaxError)
+
+    The maps are not modified; keys and doors are tracked per robot.
+    """
+    main.compile_program(code_str)  # Same validation and errors as the game
+    runner = BatchRunner(ast.parse(code_str, "<player>"), maps, step_budget)
+    runner.run()
+    return runner.result(maps)
@@ -0,0 +1,479 @@
+"""Headless MazeBot benchmarks.
+
+Usage: python benchmark.py [frames|interpreters|batch|search|generate|suite ...] [--frames N]
+                           [--repeat N] [--mazes N] [--seed N]
+                           [--save FILE] [--compare FILE]
+
+frames        worst-case frame time of the editor while the live preview keeps
+              re-simulating pathological player programs
+interpreters  speed of the compiled interpreter against running player code
+              through exec
+batch         batch evaluation across many mazes (needs NumPy) against
+              simulating them one by one
+search        scaling of the grid search engine with the maze size, against
+              the list-queue search it replaced
+generate      time and memory of carving very large mazes with the backtracker
+              against streaming them row by row
+suite         time and allocations of the core map, search, simulation and
+              drawing functions on seeded mazes of every shipped grid size;
+              --save writes the numbers as a JSON baseline and --compare
+              diffs them against an earlier one
+
+With no names given, every benchmark runs.
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import argparse
+import ast
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+import pygame
+import main
+import mazegen
+try:
+    import batch
+except ImportError:  # NumPy is optional
+    batch = None
+
+FRAME_BUDGET_MS = 1000 / main.FPS
+
+PATHOLOGICAL_PROGRAMS = {
+    "huge move loop": "for i in range(10**9):\n    move()",
+    "infinite while": "while True:\n    turn_left()",
+    "busy loop": "while True:\n    pass",
+    "nested loops": "for i in range(10**4):\n    for j in range(10**4):\n        if wall_ahead():\n            turn_right()",
+    "deep recursion": "def f():\n    f()\nf()",
+}
+
+INTERPRETER_PROGRAMS = {
+    "turns": "for i in range(200000):\n    turn_left()",
+    "wall follower": (
+        "for i in range(50000):\n"
+        "    if path_right():\n"
+        "        turn_right()\n"
+        "        move()\n"
+        "    elif not wall_ahead():\n"
+        "        move()\n"
+        "    else:\n"
+        "        turn_left()"
+    ),
+    "function calls": (
+        "def step():\n"
+        "    if wall_ahead():\n"
+        "        turn_left()\n"
+        "    else:\n"
+        "        move()\n"
+        "for i in range(50000):\n"
+        "    step()"
+    ),
+}
+
+
+def bench_frame_times(frames):
+    game = main.Game()
+    game.set_difficulty("EXTREME")
+    print(f"Frame budget: {FRAME_BUDGET_MS:.1f} ms")
+    for name, code in PATHOLOGICAL_PROGRAMS.items():
+        # One untimed frame first: the first draw and preview of a program pay one-time setup
+        game.editor.set_text(code + "\n\n")
+        game.last_live_update = -game.live_update_interval
+        game.update()
+        game.draw()
+        worst = worst_sim = 0.0
+        for i in range(frames):
+            game.editor.set_text(code + "\n" * (i % 2)) # New text every frame defeats caching
+            game.last_live_update = -game.live_update_interval # Force the live preview
+            start = time.perf_counter()
+            game.update()
+            sim_done = time.perf_counter()
+            game.draw()
+            end = time.perf_counter()
+            worst = max(worst, (end - start) * 1000)
+            worst_sim = max(worst_sim, (sim_done - start) * 1000)
+        status = "ok" if worst <= FRAME_BUDGET_MS else "OVER BUDGET"
+        print(f"{name:>16}: worst update {worst_sim:6.2f} ms, worst frame {worst:6.2f} ms  [{status}]")
+
+
+class TickInserter(ast.NodeTransformer):
+    """Step accounting for exec: a __tick__() call at the top of every loop and function body"""
+    def visit_For(self, node):
+        self.generic_visit(node)
+        node.body.insert(0, ast.copy_location(ast.Expr(ast.Call(ast.Name("__tick__", ast.Load()), [], [])), node))
+        return node
+    
+    visit_While = visit_For
+    visit_FunctionDef = visit_For
+
+
+class ExecRobot:
+    """Reference for the compiler: player code run through exec with bound primitives
+    
+    Keeps the same bookkeeping as main.RobotSim (step budget, keys and doors,
+    run-length encoded actions, visited path) so only the dispatch differs.
+    """
+    def __init__(self, game_map, step_budget=10**9):
+        self.map = game_map
+        self.x, self.y = game_map.start_pos
+        self.direction = 1
+        self.keys_held = 0
+        self.keys = set(game_map.keys)
+        self.doors = set(game_map.doors)
+        self.path = [game_map.start_pos]
+        self.actions = main.ActionStream()
+        self.steps = 0
+        self.step_budget = step_budget
+        self.calls = 0
+    
+    def tick(self):
+        self.steps += 1
+        if self.steps > self.step_budget:
+            raise main.SimulationAborted("Step limit exceeded")
+    
+    def move(self):
+        self.tick()
+        self.calls += 1
+        dx, dy = main.DIRECTION_VECTORS[self.direction]
+        target = (self.x + dx, self.y + dy)
+        self.actions.push(main.MOVE_ACTION)
+        if target in self.keys:
+            self.keys.discard(target)
+            self.keys_held += 1
+        if target in self.doors:
+            if self.keys_held == 0:
+                raise main.RobotCrashed()
+            self.doors.discard(target)
+            self.keys_held -= 1
+        if self.map.is_wall(*target):
+            raise main.RobotCrashed()
+        self.x, self.y = target
+        self.path.append(target)
+    
+    def turn(self, turn, action):
+        self.tick()
+        self.calls += 1
+        self.direction = (self.direction + turn) % 4
+        self.actions.push(action)
+    
+    def sense(self, turn):
+        self.tick()
+        self.calls += 1
+        dx, dy = main.DIRECTION_VECTORS[(self.direction + turn) % 4]
+        return self.map.is_wall(self.x + dx, self.y + dy)
+    
+    def run(self, code_str):
+        tree = ast.fix_missing_locations(TickInserter().visit(ast.parse(code_str)))
+        env = {
+            "__builtins__": {},
+            "__tick__": self.tick,
+            "move": self.move,
+            "turn_left": lambda: self.turn(3, main.TURN_LEFT_ACTION),
+            "turn_right": lambda: self.turn(1, main.TURN_RIGHT_ACTION),
+            "wall_ahead": lambda: self.sense(0),
+            "path_left": lambda: not self.sense(3),
+            "path_right": lambda: not self.sense(1),
+            "range": range,
+            "print": lambda *values: None,
+        }
+        exec(compile(tree, "<player>", "exec"), env)
+        return self
+
+
+def best_time(run, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_interpreters(repeat):
+    game_map = main.GameMap(72)
+    game_map.generate_maze(0)
+    print("Interpreter speed on a 72x72 maze (primitive calls per second):")
+    for name, code in INTERPRETER_PROGRAMS.items():
+        calls = ExecRobot(game_map).run(code).calls
+        exec_time = best_time(lambda: ExecRobot(game_map).run(code), repeat)
+        program = main.compile_program(code)
+        def run_compiled():
+            sim = main.RobotSim(game_map, game_map.start_pos, step_budget=10**9)
+            assert sim.run(program) is None and sim.crashed is None
+        compiled_time = best_time(run_compiled, repeat)
+        print(f"{name:>16}: exec {calls / exec_time / 1e6:5.2f} M/s, compiled {calls / compiled_time / 1e6:5.2f} M/s"
+              f"  ({exec_time / compiled_time:.1f}x)")
+
+
+def bench_batch(mazes):
+    if batch is None:
+        print("Batch evaluation: skipped (NumPy is not installed)")
+        return
+    maps = []
+    for seed in range(mazes):
+        game_map = main.GameMap(24, seed)
+        game_map.generate_maze(3)
+        maps.append(game_map)
+    print(f"Batch evaluation over {mazes} mazes of 24x24:")
+    for name, code in INTERPRETER_PROGRAMS.items():
+        start = time.perf_counter()
+        for game_map in maps:
+            main.simulate_program(code, game_map, game_map.start_pos, step_budget=10000)
+        looped = time.perf_counter() - start
+        start = time.perf_counter()
+        result = batch.evaluate(code, maps, step_budget=10000)
+        batched = time.perf_counter() - start
+        print(f"{name:>16}: one by one {looped * 1000:7.1f} ms, batched {batched * 1000:7.1f} ms"
+              f"  ({looped / batched:.1f}x, {int(result.reached_goal.sum())} reached the goal)")
+
+
+SEARCH_SIZES = (32, 64, 128, 256)
+SEARCH_REFERENCE_MAX = 128  # The list-queue reference is quadratic; skip it above this size
+
+
+def reference_find_path(game_map, start, end):
+    """The search GameMap used before gridsearch: list queue with pop(0) and a copied path per node"""
+    queue = [(start, [])]
+    visited = {start}
+    while queue:
+        (cx, cy), path = queue.pop(0)
+        if (cx, cy) == end:
+            return path + [(cx, cy)]
+        for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
+            nx, ny = cx + dx, cy + dy
+            if not game_map.is_wall(nx, ny) and (nx, ny) not in visited:
+                visited.add((nx, ny))
+                queue.append(((nx, ny), path + [(cx, cy)]))
+    return None
+
+
+def reference_distances(game_map, start, block_list):
+    """Distance flood as GameMap did it before gridsearch, with a pop(0) list queue"""
+    queue = [(start, 0)]
+    visited = {start: 0}
+    block_set = set(block_list)
+    while queue:
+        (cx, cy), dist = queue.pop(0)
+        for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
+            nx, ny = cx + dx, cy + dy
+            if not game_map.is_wall(nx, ny) and (nx, ny) not in block_set and (nx, ny) not in visited:
+                visited[(nx, ny)] = dist + 1
+                queue.append(((nx, ny), dist + 1))
+    return visited
+
+
+def bench_search(repeat):
+    print("Grid search scaling (microseconds per grid cell; a flat column means linear time):")
+    print(f"{'size':>9}" + "".join(f"{name:>11}" for name in ("path", "reference", "flood", "reference")))
+    for size in SEARCH_SIZES:
+        game_map = main.GameMap(size, size)
+        start, goal = game_map.start_pos, game_map.goal_pos
+        cells = size * size
+        columns = [
+            (lambda: game_map.find_path(start, goal), True),
+            (lambda: reference_find_path(game_map, start, goal), size <= SEARCH_REFERENCE_MAX),
+            (lambda: game_map.get_reachable_distances(start, []), True),
+            (lambda: reference_distances(game_map, start, []), size <= SEARCH_REFERENCE_MAX),
+        ]
+        line = f"{size:>4}x{size:<4}"
+        for function, enabled in columns:
+            if enabled:
+                best = min(timed(function) for _ in range(repeat))
+                line += f"{best * 1e6 / cells:11.3f}"
+            else:
+                line += f"{'-':>11}"
+        print(line)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+GENERATE_SIZES = (128, 256, 512, 1024, 2048)
+GENERATE_BACKTRACKER_MAX = 512  # The backtracker takes seconds and tens of MB beyond this
+
+
+def carve_backtracker(size):
+    game_map = main.GameMap(size, size, generate=False)
+    game_map.cells = bytearray([main.CELL_WALL]) * (game_map.stride * game_map.stride)
+    game_map.carve_backtracker()
+
+
+def stream_rows(size):
+    for row in mazegen.eller_rows(size, random.Random(size)):
+        pass
+
+
+def bench_generate():
+    print("Maze carving (milliseconds and peak KiB allocated; streaming keeps one row of state):")
+    print(f"{'size':>11}{'backtracker':>22}{'streaming':>22}")
+    for size in GENERATE_SIZES:
+        line = f"{size:>5}x{size:<5}"
+        for function, enabled in ((carve_backtracker, size <= GENERATE_BACKTRACKER_MAX), (stream_rows, True)):
+            if enabled:
+                elapsed = timed(lambda: function(size))
+                tracemalloc.start()
+                function(size)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                line += f"{elapsed * 1000:11.0f} ms{peak / 1024:7.0f} KiB"
+            else:
+                line += f"{'-':>22}"
+        print(line)
+
+
+SUITE_SIZES = (10, 16, 24, 32, 48, 64, 72)  # Every grid size the game ships with some level of
+SUITE_PROGRAM = (  # Representative player program: right-hand wall follower
+    "for i in range(400):\n"
+    "    if path_right():\n"
+    "        turn_right()\n"
+    "        move()\n"
+    "    elif not wall_ahead():\n"
+    "        move()\n"
+    "    else:\n"
+    "        turn_left()"
+)
+REGRESSION_RATIO = 1.25  # --compare flags timings that got this much slower
+
+
+def seeded_map(size, seed):
+    game_map = main.GameMap(size, seed * 1000 + size)
+    game_map.generate_maze(main.door_count("EXTREME" if size >= 24 else "NORMAL", size))
+    return game_map
+
+
+def measure(function, repeat):
+    """Best and median wall time in ms, plus peak and retained allocations in KiB of one extra call"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_ms": round(min(times), 4),
+        "median_ms": round(statistics.median(times), 4),
+        "peak_kib": round((peak - before) / 1024, 2),
+        "retained_kib": round((current - before) / 1024, 2),
+    }
+
+
+def suite_cases(size, seed):
+    """(name, function) pairs to measure on one seeded maze of the given size"""
+    game_map = seeded_map(size, seed)
+    tile_size = min(main.GAME_VIEW_WIDTH // size, (main.SCREEN_HEIGHT - main.HUD_HEIGHT) // size)
+    surface = pygame.Surface((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    game = types.SimpleNamespace(map=game_map)  # All calculate_optimal_lines needs from Game
+    tracker = main.PathTracker(game_map)
+    tracker.simulate_code(SUITE_PROGRAM)
+    for pos in tracker.predicted_path:
+        tracker.update_from_player(pos)
+
+    def generate_maze():
+        main.GameMap(size, seed).generate_maze(main.door_count("EXTREME" if size >= 24 else "NORMAL", size))
+
+    return [
+        ("GameMap.generate_maze", generate_maze),
+        ("GameMap.find_path", lambda: game_map.find_path(game_map.start_pos, game_map.goal_pos)),
+        ("GameMap.get_reachable_distances", lambda: game_map.get_reachable_distances(game_map.start_pos, game_map.doors)),
+        ("Game.calculate_optimal_lines", lambda: main.Game.calculate_optimal_lines(game)),
+        ("PathTracker.simulate_code", lambda: main.PathTracker(game_map).simulate_code(SUITE_PROGRAM)),
+        ("PathTracker.draw", lambda: tracker.draw(surface, tile_size, 0, main.HUD_HEIGHT)),
+        ("GameMap.draw", lambda: game_map.draw(surface, tile_size, 0, main.HUD_HEIGHT)),
+    ]
+
+
+def bench_suite(repeat, seed, save=None, compare=None):
+    """Run the suite; returns the number of regressions against compare"""
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    results = {}
+    print(f"Suite (seed {seed}, best of {repeat}):")
+    print(f"{'function':>32} {'size':>5} {'best ms':>9} {'median ms':>10} {'peak KiB':>9} {'kept KiB':>9}")
+    for size in SUITE_SIZES:
+        for name, function in suite_cases(size, seed):
+            stats = measure(function, repeat)
+            results.setdefault(name, {})[str(size)] = stats
+            print(f"{name:>32} {size:>5} {stats['best_ms']:9.3f} {stats['median_ms']:10.3f}"
+                  f" {stats['peak_kib']:9.1f} {stats['retained_kib']:9.1f}")
+    baseline = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "pygame": pygame.version.ver, "seed": seed, "repeat": repeat},
+        "results": results,
+    }
+    if save:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {save}")
+    if compare:
+        with open(compare, encoding="utf-8") as f:
+            return compare_suites(json.load(f), baseline)
+    return 0
+
+
+def compare_suites(old, new):
+    """Print best-time and peak-allocation ratios new/old; returns the number of regressions"""
+    print(f"Compared with the baseline (regression: {REGRESSION_RATIO}x slower):")
+    regressions = 0
+    for name, sizes in new["results"].items():
+        for size, stats in sizes.items():
+            before = old["results"].get(name, {}).get(size)
+            if before is None:
+                print(f"{name:>32} {size:>5}  new")
+                continue
+            ratio = stats["best_ms"] / before["best_ms"] if before["best_ms"] else float("inf")
+            peak = f"{stats['peak_kib'] - before['peak_kib']:+9.1f} KiB peak"
+            flag = ""
+            if ratio >= REGRESSION_RATIO:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif ratio <= 1 / REGRESSION_RATIO:
+                flag = "  faster"
+            print(f"{name:>32} {size:>5} {before['best_ms']:9.3f} -> {stats['best_ms']:9.3f} ms"
+                  f" ({ratio:5.2f}x) {peak}{flag}")
+    return regressions
+
+
+BENCHMARKS = ("frames", "interpreters", "batch", "search", "generate", "suite")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmarks", nargs="*", help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--frames", type=int, default=30, help="frames per program")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per interpreter, search and suite measurement")
+    parser.add_argument("--mazes", type=int, default=1000, help="mazes per batch evaluation")
+    parser.add_argument("--seed", type=int, default=1, help="maze seed for the suite")
+    parser.add_argument("--save", help="write the suite results to this JSON file")
+    parser.add_argument("--compare", help="diff the suite results against this JSON baseline")
+    args = parser.parse_args()
+    selected = args.benchmarks or BENCHMARKS
+    for name in selected:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+    if "frames" in selected:
+        bench_frame_times(args.frames)
+    if "interpreters" in selected:
+        bench_interpreters(args.repeat)
+    if "batch" in selected:
+        bench_batch(args.mazes)
+    if "search" in selected:
+        bench_search(args.repeat)
+    if "generate" in selected:
+        bench_generate()
+    if "suite" in selected:
+        if bench_suite(args.repeat, args.seed, args.save, args.compare):
+            sys.exit(1)
@@ -0,0 +1,148 @@
+"""Headless MazeBot grader.
+
+Usage: python grader.py PROGRAM_DIR [--difficulties D ...] [--seeds S ...]
+                        [--levels N ...] [--timeout SECONDS] [--workers N]
+                        [--output FILE] [--pack PACK]
+
+Runs every player program in PROGRAM_DIR against every (difficulty, seed,
+level) maze on a process pool and streams one JSON object per line as the
+results come in. Mazes are generated exactly as the game generates them from
+the seed, or read from a level pack built by levelpack.py; programs run with
+the game's move, key and door rules.
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import argparse
+import concurrent.futures
+import glob
+import itertools
+import json
+import sys
+import time
+import main
+import levelpack
+
+_maps = {}  # (difficulty, seed, level) -> GameMap, per worker process
+_packs = {}  # Path -> LevelPack, per worker process
+
+
+def build_map(difficulty, seed, level, pack_path=None):
+    key = (difficulty, seed, level)
+    game_map = _maps.get(key)
+    if game_map is None:
+        grid_size = main.level_grid_size(difficulty, level)
+        level_pack = open_pack(pack_path) if pack_path else None
+        stored = level_pack.get(difficulty, grid_size, seed) if level_pack else None
+        if stored:
+            game_map = stored[0]
+        else:
+            game_map = main.GameMap(grid_size, seed)
+            game_map.generate_maze(main.door_count(difficulty, grid_size))
+        _maps[key] = game_map
+    return game_map
+
+
+def open_pack(path):
+    """The level pack at path, opened once per worker process"""
+    level_pack = _packs.get(path)
+    if level_pack is None:
+        level_pack = _packs[path] = levelpack.LevelPack(path)
+    return level_pack
+
+
+def grade(name, code_str, difficulty, seed, level, timeout, step_budget, pack_path=None):
+    """Run one program on one maze in a worker process and return its JSON record"""
+    start = time.perf_counter()
+    record = {"program": name, "difficulty": difficulty, "seed": seed, "level": level}
+    try:
+        game_map = build_map(difficulty, seed, level, pack_path)
+    except ValueError as e:
+        record["error"] = str(e)
+        return record
+    lines_used = main.count_code_lines(code_str.split("\n"))
+    line_cost = main.DIFFICULTY_LINE_COSTS[difficulty]
+    result = main.simulate_program(code_str, game_map, game_map.start_pos, 1,
+                                   step_budget=step_budget, deadline_ms=timeout * 1000)
+    final = result.final_state[:2]
+    record.update({
+        "grid_size": game_map.size,
+        "reached_goal": result.ok and final == game_map.goal_pos,
+        "lines_used": lines_used,
+        "line_cost": line_cost,
+        "coin_cost": lines_used * line_cost,
+        "steps": result.steps,
+        "final_pos": list(final),
+        "crashed": list(result.crashed) if result.crashed else None,
+        "timed_out": result.aborted and result.error.startswith("Time limit"),
+        "error": result.error,
+        "wall_time_ms": round((time.perf_counter() - start) * 1000, 3),
+    })
+    return record
+
+
+def load_programs(directory, pattern):
+    programs = []
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                programs.append((os.path.relpath(path, directory), f.read()))
+    return programs
+
+
+def run(programs, mazes, timeout, step_budget, workers, out, pack_path=None):
+    """Grade every program on every maze, writing records to out as they finish; returns the number of failed tasks
+
+    The per-task timeout is enforced inside the task by the simulation deadline,
+    so a slow program never holds up a worker past its time.
+    """
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for (name, code_str), (difficulty, seed, level) in itertools.product(programs, mazes):
+            future = pool.submit(grade, name, code_str, difficulty, seed, level, timeout, step_budget, pack_path)
+            futures[future] = {"program": name, "difficulty": difficulty, "seed": seed, "level": level}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:  # A crashed worker still gets a line
+                record = dict(futures[future], error=f"Grader error: {e!r}")
+                failed += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("programs", help="directory of player programs")
+    parser.add_argument("--pattern", default="*.py", help="glob for program files (default: *.py)")
+    parser.add_argument("--difficulties", nargs="+", default=["NORMAL"], type=str.upper,
+                        choices=sorted(main.DIFFICULTY_GRID_SIZES))
+    parser.add_argument("--seeds", nargs="+", default=["0"], help="maze seeds, e.g. 1 2 3 or 1-100")
+    parser.add_argument("--levels", nargs="+", type=int, default=[1], help="levels (grid sizes) to grade on")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds per program and maze")
+    parser.add_argument("--step-budget", type=int, default=main.SIM_STEP_BUDGET, help="steps per program and maze")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--pack", help="level pack to take mazes from (see levelpack.py); missing ones are generated")
+    args = parser.parse_args()
+    try:
+        seeds = levelpack.parse_seeds(args.seeds)
+        for difficulty, level in itertools.product(args.difficulties, args.levels):
+            main.level_grid_size(difficulty, level)
+    except ValueError as e:
+        parser.error(str(e))
+
+    programs = load_programs(args.programs, args.pattern)
+    if not programs:
+        sys.exit(f"No programs matching {args.pattern} in {args.programs}")
+    mazes = list(itertools.product(args.difficulties, seeds, args.levels))
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        failed = run(programs, mazes, args.timeout, args.step_budget, args.workers, out, args.pack)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.exit(1 if failed else 0)
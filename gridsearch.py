@@ -0,0 +1,57 @@
+"""Breadth-first search on flat grids.
+
+A grid is a flat sequence of cells in row-major order, `stride` cells per
+row, where a nonzero cell is a wall. The grid must be surrounded by walls so
+that no neighbour of an open cell falls outside it; cells are then plain
+indices and a step is one addition. Neighbours are visited north, east,
+south, west, so every search finds the same shortest path as the game always
+has.
+
+Extra cells can be closed for a single search by passing any number of
+blocked-cell collections (doors, cells already used, ...).
+"""
+
+
+def neighbor_steps(stride):
+    """Index offsets of the N, E, S and W neighbours"""
+    return (-stride, 1, stride, -1)
+
+
+def search(walls, stride, start, goal=None, blocked=()):
+    """Breadth-first search from start, stopping once goal is reached
+
+    Returns (order, distance, parent): the reached cells in the order they
+    were found, and per-cell lists holding the distance from start and the
+    cell each was reached from (-1 when unreached; parent of start is -1).
+    """
+    closed = bytearray(walls)
+    for cells in blocked:
+        for cell in cells:
+            closed[cell] = 1
+    size = len(closed)
+    distance = [-1] * size
+    parent = [-1] * size
+    distance[start] = 0
+    closed[start] = 1
+    order = [start]
+    north, east, south, west = neighbor_steps(stride)
+    head = 0
+    while head < len(order):
+        cell = order[head]
+        head += 1
+        if cell == goal:
+            break
+        next_distance = distance[cell] + 1
+        for neighbor in (cell + north, cell + east, cell + south, cell + west):
+            if not closed[neighbor]:
+                closed[neighbor] = 1
+                distance[neighbor] = next_distance
+                parent[neighbor] = cell
+                order.append(neighbor)
+    return order, distance, parent
+
+
+def distances(walls, stride, start, blocked=()):
+    """(cell, distance) of every cell reachable from start, nearest first"""
+    order, distance, parent = search(walls, stride, start, blocked=blocked)
+    return [(cell, distance[cell]) for cell in order]
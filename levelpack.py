@@ -0,0 +1,175 @@
+"""MazeBot level packs.
+
+Usage: python levelpack.py build PACK [--difficulties D ...] [--seeds S ...]
+                                      [--levels N ...] [--workers N]
+       python levelpack.py info PACK
+
+A pack holds ready-made levels, each stored as its bit-packed walls, start,
+goal, keys, doors and optimal line count, so everyone who loads it plays
+exactly the same mazes without generating or solving them. Levels are keyed
+by (difficulty, grid size, seed); a pack is memory-mapped and only the level
+asked for is decoded. The game plays a seed's levels from a pack with
+python main.py --seed N --pack PACK, and grader.py takes --pack as well.
+
+File layout (little-endian):
+    header   MAGIC, format version, level count
+    index    per level: difficulty, size, seed, record offset, record length
+    records  size, seed, start, goal, key and door counts, optimal lines,
+             key and door positions, then size * size wall bits row by row
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import argparse
+import concurrent.futures
+import itertools
+import mmap
+import struct
+import sys
+import main
+
+MAGIC = b"MZPK"
+FORMAT_VERSION = 1
+DIFFICULTIES = tuple(main.DIFFICULTY_GRID_SIZES)  # Stored by position
+HEADER = struct.Struct("<4sHI")
+INDEX_ENTRY = struct.Struct("<BHIQI")
+RECORD = struct.Struct("<HIHHHHBBI")
+POSITION = struct.Struct("<HH")
+SEEDS = range(2 ** 32)  # Seeds are stored as uint32, the range GameMap draws unseeded mazes from
+BITS_TO_CELLS = bytes.maketrans(b"01", bytes([main.CELL_FLOOR, main.CELL_WALL]))
+CELLS_TO_BITS = bytes.maketrans(bytes([main.CELL_FLOOR, main.CELL_WALL]), b"01")
+
+
+def parse_seeds(values):
+    """Seeds given as single numbers or inclusive ranges such as 1-100"""
+    seeds = []
+    for value in values:
+        first, _, last = value.partition("-")
+        try:
+            seeds.extend(range(int(first), int(last or first) + 1))
+        except ValueError:
+            raise ValueError(f"bad seed {value!r}: expected N or FIRST-LAST, 0 to {SEEDS[-1]}") from None
+    for seed in seeds:
+        if seed not in SEEDS:
+            raise ValueError(f"seed {seed} is out of range (0 to {SEEDS[-1]})")
+    return seeds
+
+
+def encode_level(game_map, optimal_lines):
+    """One level record"""
+    if game_map.seed not in SEEDS:
+        raise ValueError(f"seed {game_map.seed} is out of range (0 to {SEEDS[-1]})")
+    cells = game_map.size * game_map.size
+    bits = int(game_map.wall_rows().translate(CELLS_TO_BITS), 2).to_bytes((cells + 7) // 8, "big")
+    return b"".join([
+        RECORD.pack(game_map.size, game_map.seed, *game_map.start_pos, *game_map.goal_pos,
+                    len(game_map.keys), len(game_map.doors), optimal_lines),
+        *(POSITION.pack(*pos) for pos in game_map.keys + game_map.doors),
+        bits,
+    ])
+
+
+def decode_level(data):
+    """(GameMap, optimal lines) of one level record"""
+    size, seed, start_x, start_y, goal_x, goal_y, key_count, door_count, optimal_lines = RECORD.unpack_from(data)
+    offset = RECORD.size
+    positions = [POSITION.unpack_from(data, offset + i * POSITION.size) for i in range(key_count + door_count)]
+    offset += len(positions) * POSITION.size
+    cells = size * size
+    bits = int.from_bytes(data[offset:offset + (cells + 7) // 8], "big")
+    walls = format(bits, f"0{cells}b").encode().translate(BITS_TO_CELLS)
+    game_map = main.GameMap(size, seed, generate=False)
+    game_map.start_pos = (start_x, start_y)
+    game_map.set_layout(walls, (goal_x, goal_y), positions[:key_count], positions[key_count:])
+    return game_map, optimal_lines
+
+
+def write_pack(path, levels):
+    """Write levels, an iterable of (difficulty, GameMap, optimal lines), as a pack"""
+    records = [((DIFFICULTIES.index(difficulty), game_map.size, game_map.seed), encode_level(game_map, optimal_lines))
+               for difficulty, game_map, optimal_lines in levels]
+    offset = HEADER.size + INDEX_ENTRY.size * len(records)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records)))
+        for key, record in records:
+            f.write(INDEX_ENTRY.pack(*key, offset, len(record)))
+            offset += len(record)
+        for key, record in records:
+            f.write(record)
+
+
+class LevelPack:
+    """Read-only, memory-mapped level pack"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} level pack")
+        self.index = {}  # (difficulty, size, seed) -> (offset, length)
+        for difficulty, size, seed, offset, length in INDEX_ENTRY.iter_unpack(
+                self.data[HEADER.size:HEADER.size + INDEX_ENTRY.size * count]):
+            self.index[(DIFFICULTIES[difficulty], size, seed)] = (offset, length)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, difficulty, size, seed):
+        """(GameMap, optimal lines) of the level, or None if the pack does not have it"""
+        entry = self.index.get((difficulty, size, seed))
+        if entry is None:
+            return None
+        offset, length = entry
+        return decode_level(self.data[offset:offset + length])
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build(task):
+    difficulty, seed, level = task
+    grid_size = main.level_grid_size(difficulty, level)
+    game_map, optimal_lines = main.build_level(difficulty, grid_size, seed)
+    return difficulty, game_map, optimal_lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="generate levels into a new pack")
+    build_parser.add_argument("pack")
+    build_parser.add_argument("--difficulties", nargs="+", default=["NORMAL"], type=str.upper,
+                              choices=sorted(main.DIFFICULTY_GRID_SIZES))
+    build_parser.add_argument("--seeds", nargs="+", default=["0"], help="maze seeds, e.g. 1 2 3 or 1-100")
+    build_parser.add_argument("--levels", nargs="+", type=int, default=[1], help="levels (grid sizes) to include")
+    build_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    info_parser = commands.add_parser("info", help="list the levels in a pack")
+    info_parser.add_argument("pack")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            tasks = list(itertools.product(args.difficulties, parse_seeds(args.seeds), args.levels))
+            for difficulty, _, level in tasks:
+                main.level_grid_size(difficulty, level)
+        except ValueError as e:
+            sys.exit(str(e))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+            write_pack(args.pack, pool.map(build, tasks, chunksize=8))
+        print(f"Wrote {len(tasks)} levels to {args.pack} ({os.path.getsize(args.pack)} bytes)")
+    else:
+        with LevelPack(args.pack) as pack:
+            print(f"{len(pack)} levels")
+            for (difficulty, size, seed), (offset, length) in sorted(pack.index.items()):
+                print(f"{difficulty:>8} {size:>3}x{size:<3} seed {seed:<10} {length:>5} bytes")
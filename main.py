@@ -1,8 +1,20 @@
 import pygame
 import sys
+import argparse
 import traceback
 import math
 import random
+import itertools
+import ast
+import time
+import threading
+import concurrent.futures
+import multiprocessing
+from array import array
+from collections import OrderedDict, deque
+import gridsearch
+import mazegen
+import solver
 # --- Constants & Configuration ---
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
@@ -52,12 +64,69 @@ STARTING_COINS = 200
 LINE_COST = 10
 ANIMATION_DURATION_MS = 400 
 LEVEL_REWARD_BASE = 200
+DIFFICULTY_GRID_SIZES = {"NORMAL": 10, "HARD": 16, "EXTREME": 24} # Grid size of level 1
+DIFFICULTY_LINE_COSTS = {"NORMAL": 10, "HARD": 15, "EXTREME": 20} # Coins per line of code
+LEVEL_PIPELINE_DEPTH = 2 # Upcoming levels generated in the background while the player codes
+DIRECTION_VECTORS = ((0, -1), (1, 0), (0, 1), (-1, 0)) # 0=N, 1=E, 2=S, 3=W
+# Map cells
+CELL_FLOOR, CELL_WALL, CELL_KEY, CELL_DOOR, CELL_GOAL = 0, 1, 2, 3, 4
+WALL_TABLE = bytes(1 if cell == CELL_WALL else 0 for cell in range(256)) # bytes.translate table: walls -> 1, rest -> 0
+STREAMING_MAZE_SIZE = 512 # Mazes this big and up are carved row by row (mazegen) instead of by backtracking
+MAZE_ATTEMPTS = 20 # Layouts tried per door count before generate_maze settles for one door fewer
+# Actions
+MOVE_ACTION = ('MOVE',)
+TURN_LEFT_ACTION = ('TURN', 'LEFT')
+TURN_RIGHT_ACTION = ('TURN', 'RIGHT')
+# Simulation
+PROGRAM_CACHE_SIZE = 64  # Max cached programs / simulation results (LRU)
+SIM_STEP_BUDGET = 100000  # Max primitive calls + loop iterations per program
+SIM_CALL_DEPTH = 200  # Max nested player function calls, the same in RobotSim and batch
+SIM_PREVIEW_DEADLINE_MS = 200  # Live preview runs on a background thread
+SIM_RUN_DEADLINE_MS = 250  # RUN is simulated to the end before anything moves or is charged
+# Drawing
+PATH_GRADIENT_STEPS = 32  # Colours in the predicted path's start-to-end gradient
+EDITOR_TOKEN_CACHE_SIZE = 512  # Rendered words and line numbers kept by the editor (LRU)
+EDITOR_LINE_CACHE_SIZE = 256  # Rendered, highlighted lines kept by the editor (LRU)
+CONSOLE_HISTORY_FILE = None  # Path every console message is also appended to, or None to keep only the last few
 # --- Helper Functions ---
 def cubic_bezier(t):
     # Ease in-out cubic
     return t * t * (3.0 - 2.0 * t)
 def lerp(a, b, t):
     return a + (b - a) * t
+def count_code_lines(lines):
+    # Lines that cost coins: anything but blank lines and comments
+    return len([l for l in lines if l.strip() and not l.strip().startswith('#')])
+def door_count(difficulty, grid_size):
+    if difficulty == "EXTREME":
+        if grid_size >= 72: return 5
+        elif grid_size >= 64: return 4
+        elif grid_size >= 32: return 3
+        else: return 2
+    elif grid_size >= 16: # Normal/Hard threshold
+        return 1
+    return 0
+def next_grid_size(difficulty, grid_size):
+    # Grid size of the level after one of grid_size, or None once the difficulty is beaten
+    if difficulty == "EXTREME":
+        # 24 -> 32 -> 48 -> 64 -> 72
+        return {24: 32, 32: 48, 48: 64, 64: 72}.get(grid_size)
+    # Normal / Hard Scaling
+    if difficulty == "NORMAL" and grid_size >= 32:
+        return None
+    elif difficulty == "HARD" and grid_size >= 50:
+        return None
+    return grid_size + 2 if grid_size < 72 else grid_size
+def level_grid_size(difficulty, level):
+    # Grid size of the given level (1 = first) of a difficulty
+    if level < 1:
+        raise ValueError(f"levels start at 1, not {level}")
+    grid_size = DIFFICULTY_GRID_SIZES[difficulty]
+    for _ in range(level - 1):
+        grid_size = next_grid_size(difficulty, grid_size)
+        if grid_size is None:
+            raise ValueError(f"{difficulty} has fewer than {level} levels")
+    return grid_size
 # --- Classes ---
 class Button:
     def __init__(self, x, y, width, height, text, callback, font):
@@ -88,206 +157,911 @@ class Button:
         text_rect = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, text_rect)
 class Console:
-    def __init__(self, x, y, width, height, font):
+    def __init__(self, x, y, width, height, font, history_path=None):
         self.rect = pygame.Rect(x, y, width, height)
         self.font = font
-        self.logs = [] # List of (text, color)
         self.max_logs = 10
+        # Ring buffers: the oldest message drops out as a new one comes in
+        self.logs = deque(maxlen=self.max_logs) # (text, color)
+        self.surfaces = deque(maxlen=self.max_logs) # Rendered logs, None until first drawn
+        # Full history, one message per line; line-buffered so nothing is lost on exit
+        self.history = open(history_path, 'a', buffering=1, encoding='utf-8') if history_path else None
     def log(self, message, color=COLOR_TEXT):
         self.logs.append((message, color))
-        if len(self.logs) > self.max_logs:
-            self.logs.pop(0)
+        self.surfaces.append(None)
+        if self.history: self.history.write(f"{message}\n")
     
     def clear(self):
-        self.logs = []
+        self.logs.clear()
+        self.surfaces.clear()
+    
+    def close(self):
+        if self.history:
+            self.history.close()
+            self.history = None
     def draw(self, surface):
         pygame.draw.rect(surface, COLOR_CONSOLE_BG, self.rect)
         pygame.draw.line(surface, COLOR_GRID, (self.rect.left, self.rect.top), (self.rect.right, self.rect.top))
         
         y = self.rect.top + 5
-        for text, color in self.logs:
-            surf = self.font.render(text, True, color)
+        for i, (text, color) in enumerate(self.logs):
+            surf = self.surfaces[i]
+            if surf is None:
+                surf = self.surfaces[i] = self.font.render(text, True, color)
             surface.blit(surf, (self.rect.left + 5, y))
             y += 20
-class PathTracker:
-    def __init__(self, game_map):
+class SimulationAborted(Exception):
+    """Raised when a run is stopped by the step budget, deadline or cancellation"""
+class RobotCrashed(Exception):
+    """Raised inside a compiled program when the robot hits a wall or a locked door"""
+class Program:
+    """Player code compiled to a Python function for RobotSim.run"""
+    __slots__ = ('function', 'source', 'spans', 'uses_sensors')
+    
+    def __init__(self, function, source, spans, uses_sensors):
+        self.function = function          # function(sim, start, on_statement, grid, size)
+        self.source = source              # Generated Python source, for debugging
+        self.spans = spans                # (first_line, last_line) of each top-level statement
+        self.uses_sensors = uses_sensors  # False if the actions do not depend on the map
+class ProgramCompiler:
+    """Validates player code against the MazeBot language and compiles it to Python
+    
+    Supported: the six robot primitives, print(), for loops over range() with
+    constant arguments, while, if/elif/else, not/and/or, pass, break, continue
+    and argument-less functions defined at the top level. Anything else is
+    rejected with a SyntaxError pointing at the offending line.
+    
+    The generated function keeps the robot state in local variables and inlines
+    every primitive, so player code never goes through exec or a dict lookup.
+    Player names are prefixed with p_ to keep them apart from the runtime's.
+    """
+    SENSORS = {'wall_ahead': (0, False), 'path_left': (3, True), 'path_right': (1, True)} # (relative direction, reads "no wall")
+    PRIMITIVES = ('move', 'turn_left', 'turn_right') + tuple(SENSORS)
+    BUILTINS = ('print', 'range')
+    MAX_CONSTANT = 10 ** 12
+    STATE = 'x, y, direction, keys_held, steps, last_action, last_count, check_at'
+    NODE_NAMES = {
+        'Assign': "variables", 'AugAssign': "variables", 'AnnAssign': "variables", 'NamedExpr': "variables",
+        'Import': "imports", 'ImportFrom': "imports", 'ClassDef': "classes", 'Lambda': "lambdas",
+        'Try': "try blocks", 'With': "with blocks", 'Global': "global", 'Nonlocal': "nonlocal",
+        'Delete': "del", 'Raise': "raise", 'Assert': "assert", 'ListComp': "comprehensions",
+        'SetComp': "comprehensions", 'DictComp': "comprehensions", 'GeneratorExp': "comprehensions",
+    }
+    PROLOGUE = [
+        "def program(sim, start, on_statement, cells, stride):",
+        "    x, y, direction, keys_held, steps = sim.x, sim.y, sim.direction, sim.keys_held, sim.steps",
+        "    origin = stride + 1 # Index of (0, 0) in the padded cells",
+        "    keys, doors, path, output = sim.keys, sim.doors, sim.path, sim.output",
+        "    push, crash = sim.actions.push, sim.crash",
+        "    vectors, move_action, left_action, right_action = DIRECTION_VECTORS, MOVE_ACTION, TURN_LEFT_ACTION, TURN_RIGHT_ACTION",
+        "    last_action, last_count = None, 0 # Current run of identical actions, pushed when it ends",
+        "    check_at = sim.next_check()",
+        "    def sync():",
+        "        nonlocal last_count",
+        "        if last_count:",
+        "            push(last_action, last_count)",
+        "            last_count = 0",
+        "        sim.x, sim.y, sim.direction, sim.keys_held, sim.steps = x, y, direction, keys_held, steps",
+        "    def check():",
+        "        sync()",
+        "        return sim.check()",
+        "    def switch(action, count, new_action):",
+        "        if count:",
+        "            push(action, count)",
+        "        return new_action, 1",
+        "    def unlock(tx, ty, keys_held):",
+        "        if (tx, ty) in keys:",
+        "            keys.discard((tx, ty))",
+        "            keys_held += 1",
+        "        if (tx, ty) in doors:",
+        "            if not keys_held:",
+        "                crash((tx, ty))",
+        "            doors.discard((tx, ty))",
+        "            keys_held -= 1",
+        "        return keys_held",
+    ]
+    TICK = [
+        "steps += 1",
+        "if steps > check_at: check_at = check()",
+    ]
+    MOVE = TICK + [
+        "dx, dy = vectors[direction]",
+        "tx, ty = x + dx, y + dy",
+        "if last_action is move_action: last_count += 1",
+        "else: last_action, last_count = switch(last_action, last_count, move_action)",
+        "if keys or doors: keys_held = unlock(tx, ty, keys_held)",
+        f"if cells[ty * stride + tx + origin] == {CELL_WALL}: crash((tx, ty))",
+        "x, y = tx, ty",
+        "path.append((x, y))",
+    ]
+    TURN = TICK + [
+        "direction = (direction + {turn}) & 3",
+        "if last_action is {action}: last_count += 1",
+        "else: last_action, last_count = switch(last_action, last_count, {action})",
+    ]
+    SENSE = TICK + [
+        "dx, dy = vectors[(direction + {turn}) & 3]",
+        "tx, ty = x + dx, y + dy",
+        f"c = {{compare}}(cells[ty * stride + tx + origin] != {CELL_WALL})",
+    ]
+    
+    def compile(self, code_str):
+        tree = ast.parse(code_str, "<player>")
+        self.lines = list(self.PROLOGUE)
+        self.indent = 1
+        self.calls = [] # (caller, name, node); caller is a statement index or a function name
+        self.uses_sensors = False
+        self.function_names = {stmt.name for stmt in tree.body if isinstance(stmt, ast.FunctionDef)}
+        functions = {}
+        for index, stmt in enumerate(tree.body):
+            if isinstance(stmt, ast.FunctionDef):
+                self._check_function(stmt, functions)
+                functions[stmt.name] = index
+                self.caller, self.loops = stmt.name, []
+                self.emit(f"def p_{stmt.name}(depth):") # depth: calls in progress, this one included
+                self.indent += 1
+                self.emit(f"nonlocal {self.STATE}")
+                self.emit_lines(self.TICK)
+                self.emit(f"if depth > {SIM_CALL_DEPTH}: raise RecursionError()")
+                self.block(stmt.body)
+                self.indent -= 1
+        
+        self.emit("try:")
+        self.indent += 1
+        for index, stmt in enumerate(tree.body):
+            self.emit(f"if start <= {index}:")
+            self.indent += 1
+            self.emit_lines(["if on_statement is not None:", "    sync()", f"    on_statement({index})"])
+            if not isinstance(stmt, ast.FunctionDef): # Functions are defined up front
+                self.caller, self.loops = index, []
+                self.statement(stmt)
+            self.indent -= 1
+        self.indent -= 1
+        self.emit_lines(["finally:", "    sync()"])
+        self._link(functions)
+        
+        source = '\n'.join(self.lines)
+        namespace = {'__builtins__': {'range': range, 'str': str, 'RecursionError': RecursionError},
+                     'DIRECTION_VECTORS': DIRECTION_VECTORS,
+                     'MOVE_ACTION': MOVE_ACTION, 'TURN_LEFT_ACTION': TURN_LEFT_ACTION,
+                     'TURN_RIGHT_ACTION': TURN_RIGHT_ACTION}
+        try:
+            exec(compile(source, "<compiled player>", "exec"), namespace)
+        except SyntaxError as e: # Python's own limits, e.g. too many nested loops
+            raise SyntaxError(f"program is too complex ({e.msg})", ("<player>", 1, 1, None))
+        spans = [(stmt.lineno, stmt.end_lineno) for stmt in tree.body]
+        return Program(namespace['program'], source, spans, self.uses_sensors)
+    
+    def emit(self, line):
+        self.lines.append("    " * self.indent + line)
+    
+    def emit_lines(self, lines, **fields):
+        for line in lines:
+            self.emit(line.format(**fields) if fields else line)
+    
+    def error(self, node, message):
+        return SyntaxError(message, ("<player>", node.lineno, node.col_offset + 1, None))
+    
+    def _check_function(self, node, functions):
+        name = node.name
+        if name in functions or name in self.PRIMITIVES or name in self.BUILTINS:
+            raise self.error(node, f"function '{name}' is already defined")
+        args = node.args
+        if (args.posonlyargs or args.args or args.vararg or args.kwonlyargs or args.kwarg
+                or node.decorator_list):
+            raise self.error(node, f"function '{name}' cannot take arguments")
+    
+    def _link(self, functions):
+        # Reject calls that would run before the def statement, as Python would at runtime
+        callees = {}
+        for caller, name, node in self.calls:
+            if name not in functions:
+                raise self.error(node, f"name '{name}' is not defined")
+            callees.setdefault(caller, []).append((name, node))
+        for caller in callees:
+            if not isinstance(caller, int):
+                continue
+            seen = set()
+            pending = list(callees[caller])
+            while pending:
+                name, node = pending.pop()
+                if functions[name] > caller:
+                    raise self.error(node, f"name '{name}' is not defined")
+                if name not in seen:
+                    seen.add(name)
+                    pending.extend(callees.get(name, ()))
+    
+    def block(self, body):
+        for stmt in body:
+            self.statement(stmt)
+    
+    def statement(self, node):
+        if isinstance(node, ast.Expr):
+            if isinstance(node.value, ast.Call):
+                return self.call(node.value)
+            if isinstance(node.value, ast.Constant):
+                return self.emit("pass") # Docstrings and bare constants do nothing
+            node = node.value
+        elif isinstance(node, ast.For):
+            return self.for_loop(node)
+        elif isinstance(node, ast.While):
+            return self.while_loop(node)
+        elif isinstance(node, ast.If):
+            return self.if_statement(node)
+        elif isinstance(node, ast.Pass):
+            return self.emit("pass")
+        elif isinstance(node, (ast.Break, ast.Continue)):
+            word = 'break' if isinstance(node, ast.Break) else 'continue'
+            if not self.loops:
+                raise self.error(node, f"'{word}' outside loop")
+            return self.emit(word)
+        elif isinstance(node, ast.Return):
+            if not isinstance(self.caller, str):
+                raise self.error(node, "'return' outside function")
+            if node.value is not None:
+                raise self.error(node, "functions cannot return values")
+            return self.emit("return")
+        elif isinstance(node, ast.FunctionDef):
+            raise self.error(node, "functions can only be defined at the top level")
+        raise self.unsupported(node)
+    
+    def unsupported(self, node):
+        kind = type(node).__name__
+        return self.error(node, f"unsupported syntax: {self.NODE_NAMES.get(kind, kind)}")
+    
+    def callee(self, node):
+        if not isinstance(node.func, ast.Name):
+            raise self.error(node, "only robot commands and your own functions can be called")
+        if node.keywords:
+            raise self.error(node, f"{node.func.id}() does not take keyword arguments")
+        return node.func.id
+    
+    def call(self, node):
+        name = self.callee(node)
+        if name not in self.BUILTINS and node.args:
+            raise self.error(node, f"{name}() takes no arguments")
+        if name == 'move':
+            self.emit_lines(self.MOVE)
+        elif name == 'turn_left':
+            self.emit_lines(self.TURN, turn=3, action='left_action')
+        elif name == 'turn_right':
+            self.emit_lines(self.TURN, turn=1, action='right_action')
+        elif name in self.SENSORS:
+            self.uses_sensors = True
+            self.emit_lines(self.TICK) # Result unused
+        elif name == 'print':
+            self.print_call(node)
+        elif name == 'range':
+            raise self.error(node, "range() can only be used in a for loop")
+        else:
+            self.calls.append((self.caller, name, node))
+            self.emit(f"p_{name}({'depth + 1' if isinstance(self.caller, str) else 1})")
+    
+    def print_call(self, node):
+        if len(node.args) > 1:
+            raise self.error(node, "print() takes at most one value")
+        if not node.args:
+            return self.emit("output.append('')")
+        arg = node.args[0]
+        if isinstance(arg, ast.Name):
+            if arg.id not in self.loops:
+                raise self.error(arg, f"name '{arg.id}' is not defined")
+            return self.emit(f"output.append(str(p_{arg.id}))")
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, (str, bool, type(None))):
+            text = str(arg.value)
+        else:
+            text = str(self.constant(arg))
+        self.emit(f"output.append({text!r})")
+    
+    def constant(self, node):
+        """Fold a numeric constant expression such as 10**4 or -1"""
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = self.constant(node.operand)
+            return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.BinOp):
+            left, right = self.constant(node.left), self.constant(node.right)
+            op = node.op
+            try:
+                if isinstance(op, ast.Add):
+                    value = left + right
+                elif isinstance(op, ast.Sub):
+                    value = left - right
+                elif isinstance(op, ast.Mult):
+                    value = left * right
+                elif isinstance(op, ast.FloorDiv):
+                    value = left // right
+                elif isinstance(op, ast.Div):
+                    value = left / right
+                elif isinstance(op, ast.Mod):
+                    value = left % right
+                elif isinstance(op, ast.Pow) and abs(right) <= 64:
+                    value = left ** right
+                else:
+                    raise self.unsupported(node)
+            except (ZeroDivisionError, OverflowError) as e:
+                raise self.error(node, str(e))
+            if isinstance(value, complex) or abs(value) > self.MAX_CONSTANT:
+                raise self.error(node, "number too large")
+            return value
+        raise self.error(node, "only numbers can be used here")
+    
+    def for_loop(self, node):
+        if node.orelse:
+            raise self.error(node, "for/else is not supported")
+        if not isinstance(node.target, ast.Name):
+            raise self.error(node.target, "for loops need a single loop variable")
+        if node.target.id in self.function_names:
+            raise self.error(node.target, f"loop variable '{node.target.id}' hides the function '{node.target.id}'")
+        source = node.iter
+        if not (isinstance(source, ast.Call) and isinstance(source.func, ast.Name)
+                and source.func.id == 'range'):
+            raise self.error(source, "for loops can only iterate over range()")
+        self.callee(source)
+        args = [self.constant(arg) for arg in source.args]
+        if not 1 <= len(args) <= 3 or any(type(arg) is not int for arg in args):
+            raise self.error(source, "range() takes one to three whole numbers")
+        if len(args) == 3 and args[2] == 0:
+            raise self.error(source, "range() arg 3 must not be zero")
+        
+        self.emit(f"for p_{node.target.id} in range({', '.join(map(str, args))}):")
+        self.indent += 1
+        self.emit_lines(self.TICK)
+        self.loops.append(node.target.id)
+        self.block(node.body)
+        self.loops.pop()
+        self.indent -= 1
+    
+    def while_loop(self, node):
+        if node.orelse:
+            raise self.error(node, "while/else is not supported")
+        self.emit("while True:")
+        self.indent += 1
+        self.emit_lines(self.TICK)
+        self.condition(node.test)
+        self.emit_lines(["if not c:", "    break"])
+        self.loops.append(None) # No loop variable
+        self.block(node.body)
+        self.loops.pop()
+        self.indent -= 1
+    
+    def if_statement(self, node):
+        self.condition(node.test)
+        self.emit("if c:")
+        self.indent += 1
+        self.block(node.body)
+        self.emit("pass")
+        self.indent -= 1
+        if node.orelse:
+            self.emit("else:")
+            self.indent += 1
+            self.block(node.orelse)
+            self.emit("pass")
+            self.indent -= 1
+    
+    def condition(self, node):
+        """Emit statements that evaluate node into c, short-circuiting like Python"""
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self.condition(node.operand)
+            self.emit("c = not c")
+        elif isinstance(node, ast.BoolOp):
+            test = "if not c:" if isinstance(node.op, ast.Or) else "if c:"
+            depth = self.indent
+            self.condition(node.values[0])
+            for value in node.values[1:]:
+                self.emit(test)
+                self.indent += 1
+                self.condition(value)
+            self.indent = depth
+        elif isinstance(node, ast.Constant):
+            self.emit(f"c = {bool(node.value)}")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.SENSORS:
+            name = self.callee(node)
+            if node.args:
+                raise self.error(node, f"{name}() takes no arguments")
+            self.uses_sensors = True
+            turn, reads_open = self.SENSORS[name]
+            self.emit_lines(self.SENSE, turn=turn, compare="" if reads_open else "not ")
+        else:
+            raise self.error(node, "conditions can only use wall_ahead(), path_left(), path_right(), not, and, or")
+def compile_program(code_str):
+    """Compile player code to a Program (raises SyntaxError)"""
+    try:
+        return ProgramCompiler().compile(code_str)
+    except (RecursionError, MemoryError): # Parsing and compiling recurse once per nesting level
+        raise SyntaxError("program is too complex (nested too deeply)", ("<player>", 1, 1, None)) from None
+class SimulationResult:
+    def __init__(self, path, actions, final_state, output, error=None, aborted=False, crashed=None, steps=0):
+        self.path = path                # Visited grid positions, starting with the start cell
+        self.actions = actions          # Run-length encoded (action, count) segments for playback
+        self.final_state = final_state  # (x, y, direction) after the program ends
+        self.output = output            # Values passed to print()
+        self.error = error              # Error message or None on success
+        self.aborted = aborted          # Stopped by the step budget or deadline
+        self.crashed = crashed          # Cell of the wall/locked door the robot hit, or None
+        self.steps = steps              # Steps used, see RobotSim
+    
+    @property
+    def ok(self):
+        return self.error is None
+class ActionStream:
+    """Run-length encoded playback queue of robot actions
+    
+    Segments are (action, count) pairs, so a long straight run costs one entry.
+    A simulation pushes actions in; playback starts from a finished run's segments.
+    """
+    def __init__(self, segments=()):
+        self.segments = deque(segments)
+    
+    def push(self, action, count=1):
+        segments = self.segments
+        if segments and segments[-1][0] is action:
+            segments[-1] = (action, segments[-1][1] + count)
+        else:
+            segments.append((action, count))
+    
+    def __bool__(self):
+        return bool(self.segments)
+    
+    def popleft(self):
+        action, count = self.segments[0]
+        if count == 1:
+            self.segments.popleft()
+        else:
+            self.segments[0] = (action, count - 1)
+        return action
+    
+    def pop_run(self, action):
+        """Remove every buffered copy of action at the head of the stream and return how many"""
+        count = 0
+        while self.segments and self.segments[0][0] is action:
+            count += self.segments.popleft()[1]
+        return count
+    
+    def to_segments(self):
+        return list(self.segments)
+    
+    def close(self):
+        self.segments.clear()
+class ProgramCache:
+    """Bounded LRU cache of compiled programs and their simulation results"""
+    def __init__(self, max_entries=PROGRAM_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.programs = OrderedDict() # code_str -> Program
+        self.results = OrderedDict() # (code_str, map_id, map_version, start_pos, start_dir) -> SimulationResult
+        self.lock = threading.Lock() # Shared by the preview worker and the main thread
+    
+    def compile(self, code_str):
+        with self.lock:
+            program = self.programs.get(code_str)
+            if program is not None:
+                self.programs.move_to_end(code_str)
+                return program
+        program = compile_program(code_str) # SyntaxError propagates, nothing is stored
+        with self.lock:
+            self._store(self.programs, code_str, program)
+        return program
+    
+    def get_result(self, key):
+        with self.lock:
+            result = self.results.get(key)
+            if result is not None:
+                self.results.move_to_end(key)
+            return result
+    
+    def put_result(self, key, result):
+        with self.lock:
+            self._store(self.results, key, result)
+    
+    def clear(self):
+        with self.lock:
+            self.programs.clear()
+            self.results.clear()
+    
+    def _store(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+class RobotSim:
+    """Headless robot that runs compiled programs for both the live preview and RUN
+    
+    Movement, key pickup and door unlocking follow Game.execute_move_sequence
+    exactly; the map itself is never mutated. Every primitive, loop iteration
+    and function call costs one step.
+    """
+    __slots__ = ('map', 'x', 'y', 'direction', 'keys_held', 'keys', 'doors',
+                 'path', 'actions', 'output', 'crashed', 'halt', 'timed_out',
+                 'steps', 'step_budget', 'deadline', 'deadline_ms', 'cancelled')
+    CHECK_INTERVAL = 1024 # Steps between deadline / cancellation checks
+    
+    def __init__(self, game_map, start_pos, direction=1, step_budget=SIM_STEP_BUDGET,
+                 deadline_ms=None, cancelled=None):
         self.map = game_map
-        self.current_path = []
-        self.visited_cells = set()
-        self.predicted_path = []
-        self.last_code_hash = None
+        self.x, self.y = start_pos
+        self.direction = direction # 0=N, 1=E, 2=S, 3=W
+        self.keys_held = 0
+        self.keys = set(game_map.keys)
+        self.doors = set(game_map.doors)
+        self.path = [start_pos] # Visited positions
+        self.actions = ActionStream()
+        self.output = []
+        self.crashed = None # Cell the robot crashed into
+        self.halt = None # Why the budget, deadline or cancellation stopped the run
+        self.timed_out = False
+        self.steps = 0
+        self.step_budget = step_budget
+        self.deadline_ms = deadline_ms
+        self.deadline = time.perf_counter() + deadline_ms / 1000 if deadline_ms is not None else None
+        self.cancelled = cancelled
+    
+    def run(self, program, start=0, on_statement=None):
+        """Execute program from top-level statement start until it ends, crashes or is stopped
         
-    def simulate_code(self, code_str):
-        """Simulate the code to predict the path"""
+        on_statement(index) is called before each top-level statement, with the
+        robot state synced back onto self. Returns a runtime error or None.
+        """
         try:
-            # Create a simulation state
-            sim_x, sim_y = self.map.start_pos
-            sim_dir = 1  # Start facing East
-            
-            # Keep track of visited positions
-            visited = [(sim_x, sim_y)]
-            
-            # Define the environment for exec
-            def move():
-                nonlocal sim_x, sim_y
-                dx, dy = 0, 0
-                if sim_dir == 0: dy = -1
-                elif sim_dir == 1: dx = 1
-                elif sim_dir == 2: dy = 1
-                elif sim_dir == 3: dx = -1
-                
-                target_x, target_y = sim_x + dx, sim_y + dy
-                if not self.map.is_wall(target_x, target_y):
-                    sim_x, sim_y = target_x, target_y
-                    visited.append((sim_x, sim_y))
-                return True
-            
-            def turn_left():
-                nonlocal sim_dir
-                sim_dir = (sim_dir - 1) % 4
-                return True
-            
-            def turn_right():
-                nonlocal sim_dir
-                sim_dir = (sim_dir + 1) % 4
-                return True
-            
-            def wall_ahead():
-                dx, dy = 0, 0
-                if sim_dir == 0: dy = -1
-                elif sim_dir == 1: dx = 1
-                elif sim_dir == 2: dy = 1
-                elif sim_dir == 3: dx = -1
-                return self.map.is_wall(sim_x + dx, sim_y + dy)
-            
-            def path_left():
-                left_dir = (sim_dir - 1) % 4
-                dx, dy = 0, 0
-                if left_dir == 0: dy = -1
-                elif left_dir == 1: dx = 1
-                elif left_dir == 2: dy = 1
-                elif left_dir == 3: dx = -1
-                return not self.map.is_wall(sim_x + dx, sim_y + dy)
-            
-            def path_right():
-                right_dir = (sim_dir + 1) % 4
-                dx, dy = 0, 0
-                if right_dir == 0: dy = -1
-                elif right_dir == 1: dx = 1
-                elif right_dir == 2: dy = 1
-                elif right_dir == 3: dx = -1
-                return not self.map.is_wall(sim_x + dx, sim_y + dy)
-            
-            # Create execution environment
-            env = {
-                'move': move,
-                'turn_left': turn_left,
-                'turn_right': turn_right,
-                'wall_ahead': wall_ahead,
-                'path_left': path_left,
-                'path_right': path_right,
-                'range': range,
-                'print': lambda x: None
-            }
-            
-            # Execute the code
-            exec(code_str, {"__builtins__": {}}, env)
+            program.function(self, start, on_statement, self.map.cells, self.map.stride)
+        except RobotCrashed:
+            pass
+        except SimulationAborted:
+            pass
+        except RecursionError:
+            return "maximum recursion depth exceeded"
+        except Exception as e: # Anything else the program trips over is its runtime error
+            return f"{type(e).__name__}: {e}"
+        return None
+    
+    def next_check(self):
+        return min(self.step_budget, self.steps + self.CHECK_INTERVAL)
+    
+    def check(self):
+        """Slow path of the step counter: enforce the budget, cancellation and deadline"""
+        if self.steps > self.step_budget:
+            self.halt = f"Step limit exceeded ({self.step_budget} steps)"
+        elif self.cancelled is not None and self.cancelled():
+            self.halt = "Cancelled"
+            self.timed_out = True
+        elif self.deadline is not None and time.perf_counter() > self.deadline:
+            self.halt = f"Time limit exceeded ({self.deadline_ms} ms)"
+            self.timed_out = True
+        else:
+            return self.next_check()
+        raise SimulationAborted(self.halt)
+    
+    def crash(self, target):
+        # The real run clears the action queue here, so the program ends too
+        self.crashed = target
+        raise RobotCrashed()
+def simulation_key(code_str, game_map, start_pos, start_dir=1, step_budget=SIM_STEP_BUDGET):
+    return (code_str, game_map.map_id, game_map.version, start_pos, start_dir, step_budget)
+def simulate_program(code_str, game_map, start_pos, start_dir=1, cache=None,
+                     step_budget=SIM_STEP_BUDGET, deadline_ms=None, cancelled=None):
+    """Run player code against the map and return a SimulationResult (cached when possible)
+    
+    Every primitive call, loop iteration and function call costs one step; the
+    program is aborted once step_budget is spent, deadline_ms of wall-clock time
+    has passed or the optional cancelled() callback returns True.
+    """
+    key = simulation_key(code_str, game_map, start_pos, start_dir, step_budget)
+    if cache is not None:
+        result = cache.get_result(key)
+        if result is not None:
+            return result
+    
+    sim = RobotSim(game_map, start_pos, start_dir, step_budget, deadline_ms, cancelled)
+    try:
+        program = cache.compile(code_str) if cache is not None else compile_program(code_str)
+        error = sim.run(program)
+    except SyntaxError as e:
+        error = str(e)
+    
+    result = simulation_result(sim, error)
+    if cache is not None and not sim.timed_out: # Deadline hits and cancels depend on timing
+        cache.put_result(key, result)
+    return result
+def simulation_result(sim, error):
+    aborted = sim.halt is not None
+    if aborted:
+        error = sim.halt
+    return SimulationResult(sim.path, sim.actions.to_segments(), (sim.x, sim.y, sim.direction), sim.output,
+                            error, aborted, sim.crashed, sim.steps)
+class IncrementalSimulator:
+    """Preview simulator that resumes from checkpoints instead of starting over
+    
+    The robot state is checkpointed before every top-level statement (and after
+    the last one). After an edit, simulation resumes from the last checkpoint
+    before the first changed statement, so the cost follows the size of the
+    edit rather than the length of the program. Player programs have no
+    variables outside for loops, so the robot state is all there is to restore.
+    """
+    def __init__(self):
+        self.base = None # simulation_key() minus the program text
+        self.statements = [] # Source text of each top-level statement of the last program
+        self.checkpoints = [] # checkpoints[i]: state before statement i
+        self.result = None # Result of the last simulated program
+    
+    def simulate(self, code_str, game_map, start_pos, start_dir=1, cache=None,
+                 step_budget=SIM_STEP_BUDGET, deadline_ms=None, cancelled=None):
+        key = simulation_key(code_str, game_map, start_pos, start_dir, step_budget)
+        if cache is not None:
+            result = cache.get_result(key)
+            if result is not None:
+                return result
+        
+        sim = RobotSim(game_map, start_pos, start_dir, step_budget, deadline_ms, cancelled)
+        try:
+            program = cache.compile(code_str) if cache is not None else compile_program(code_str)
+        except SyntaxError as e:
+            return simulation_result(sim, str(e)) # Keep checkpoints for when the typo is fixed
+        
+        lines = code_str.split('\n')
+        statements = ['\n'.join(lines[first - 1:last]) for first, last in program.spans]
+        resume = 0
+        if key[1:] == self.base:
+            changed = 0
+            for old, new in zip(self.statements, statements):
+                if old != new:
+                    break
+                changed += 1
+            resume = max(0, min(changed, len(self.checkpoints) - 1))
+        
+        checkpoints = []
+        if resume > 0:
+            self._restore(sim, self.checkpoints[resume])
+            checkpoints = self.checkpoints[:resume]
+        
+        def on_statement(index):
+            checkpoints.append(self._checkpoint(sim))
+        
+        error = sim.run(program, resume, on_statement)
+        if error is None and sim.halt is None and sim.crashed is None:
+            checkpoints.append(self._checkpoint(sim))
+        
+        result = simulation_result(sim, error)
+        self.base = key[1:]
+        self.statements = statements
+        self.checkpoints = checkpoints
+        self.result = result
+        if cache is not None and not sim.timed_out:
+            cache.put_result(key, result)
+        return result
+    
+    def _checkpoint(self, sim):
+        segments = sim.actions.segments
+        return (sim.x, sim.y, sim.direction, sim.keys_held, frozenset(sim.keys), frozenset(sim.doors),
+                sim.steps, len(sim.path), len(segments), segments[-1][1] if segments else 0,
+                len(sim.output))
+    
+    def _restore(self, sim, checkpoint):
+        (sim.x, sim.y, sim.direction, sim.keys_held, keys, doors, sim.steps,
+         path_len, segment_count, last_count, output_len) = checkpoint
+        sim.keys = set(keys)
+        sim.doors = set(doors)
+        # Copy prefixes: the previous result may still be cached and on screen
+        previous = self.result
+        sim.path = previous.path[:path_len]
+        segments = sim.actions.segments
+        segments.extend(previous.actions[:segment_count])
+        if segment_count:
+            segments[-1] = (segments[-1][0], last_count)
+        sim.output = previous.output[:output_len]
+class PreviewWorker:
+    """Background thread that simulates live previews; a newer request cancels older ones"""
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.simulator = IncrementalSimulator() # Only used from the worker thread
+        self.generation = 0
+        self.job = None # (generation, tracker, tracker_generation, code_str)
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="PreviewWorker", daemon=True)
+        self.thread.start()
+    
+    def submit(self, tracker, code_str):
+        with self.cond:
+            self.generation += 1
+            self.job = (self.generation, tracker, tracker.generation, code_str)
+            self.cond.notify()
+    
+    def cancel(self):
+        """Drop the queued preview and stop the one being simulated; their results are never applied"""
+        with self.cond:
+            self.generation += 1
+            self.job = None
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.job is None:
+                    self.cond.wait()
+                generation, tracker, tracker_generation, code_str = self.job
+                self.job = None
             
-            # Update predicted path
-            self.predicted_path = visited
-            return True
+            def cancelled():
+                time.sleep(0) # Give the GIL back to the render loop between slices
+                return generation != self.generation
             
-        except Exception as e:
-            # If code has errors, clear predicted path
-            self.predicted_path = []
-            return False
+            try:
+                result = self.simulator.simulate(code_str, tracker.map, tracker.map.start_pos, 1, self.cache,
+                                                 deadline_ms=SIM_PREVIEW_DEADLINE_MS, cancelled=cancelled)
+            except Exception as e: # One bad program must not stop every later preview
+                self.simulator = IncrementalSimulator() # Its checkpoints may be half updated
+                result = SimulationResult([tracker.map.start_pos], [], (*tracker.map.start_pos, 1), [],
+                                          f"{type(e).__name__}: {e}")
+            with self.cond:
+                if generation == self.generation:
+                    tracker.apply_result(result, tracker_generation)
+class PathTracker:
+    _atlases = {} # tile_size -> path sprites, shared by every tracker
+    
+    def __init__(self, game_map, cache=None):
+        self.map = game_map
+        self.cache = cache
+        self.current_path = array('i') # Map cells the player moved through, one entry per change of cell
+        self.visited = bytearray(len(game_map.cells)) # 1 for every cell in current_path
+        self.predicted_path = []
+        self.last_code_hash = None
+        self.generation = 0 # Bumped on reset so late background results are dropped
+        self.lock = threading.Lock()
+        # Predicted path, visited cells and run path as drawn, see draw
+        self.overlay = None
+        self.overlay_path = None
+        self.overlay_tile = None
+        self.overlay_run = None # The current_path on the overlay...
+        self.overlay_steps = 0 # ...and how many of its entries are drawn
+        self.overlay_visited = None # Cells drawn as visited
+        
+    def simulate_code(self, code_str, worker=None):
+        """Simulate the code to predict the path (on the worker's thread when given)"""
+        code_hash = hash((code_str, self.map.map_id, self.map.version))
+        if code_hash == self.last_code_hash:
+            return bool(self.predicted_path) # Nothing changed since the last preview
+        self.last_code_hash = code_hash
+        
+        if worker is not None:
+            worker.submit(self, code_str)
+            return None
+        result = simulate_program(code_str, self.map, self.map.start_pos, 1, self.cache,
+                                  deadline_ms=SIM_PREVIEW_DEADLINE_MS)
+        self.apply_result(result, self.generation)
+        return result.ok
+    
+    def apply_result(self, result, generation):
+        """Swap in a finished simulation; a single assignment, so drawing never sees a partial path"""
+        with self.lock:
+            if generation != self.generation:
+                return
+            # If code has errors, clear predicted path; a budget abort still shows how far it got
+            self.predicted_path = result.path if result.ok or result.aborted else []
     
     def update_from_player(self, player_pos):
-        """Update tracking based on actual player position"""
-        self.current_path.append(player_pos)
-        self.visited_cells.add(player_pos)
+        """Update tracking based on actual player position; called every frame, it only records changes of cell"""
+        cell = self.map.cell_index(player_pos)
+        if self.current_path and self.current_path[-1] == cell:
+            return
+        self.current_path.append(cell)
+        self.visited[cell] = 1
     
     def reset(self):
         """Reset tracking"""
-        self.current_path = []
-        self.visited_cells = set()
-        self.predicted_path = []
-        self.last_code_hash = None
+        with self.lock:
+            self.current_path = array('i')
+            self.visited = bytearray(len(self.map.cells))
+            self.predicted_path = []
+            self.last_code_hash = None
+            self.generation += 1
+    
+    @classmethod
+    def path_atlas(cls, tile_size):
+        """Path sprites for a tile size, built once: (dots, segments, visited tile)
+        
+        dots[step] and segments[step][(dx, dy)] are drawn in the colour of that
+        step of the start-to-end gradient; a segment is (sprite, anchor), the
+        anchor being where the tile centre it starts from sits in the sprite.
+        """
+        atlas = cls._atlases.get(tile_size)
+        if atlas is None:
+            radius = tile_size // 6
+            width = max(2, tile_size // 8)
+            dots, segments = [], []
+            for step in range(PATH_GRADIENT_STEPS):
+                # Make the path gradient (darker at start, lighter at end)
+                intensity = step / PATH_GRADIENT_STEPS
+                color = (int(50 + 150 * intensity), int(200 + 55 * intensity), 50, 150)
+                dot = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+                pygame.draw.circle(dot, color, (radius, radius), radius)
+                dots.append(dot)
+                lines = {}
+                for dx, dy in DIRECTION_VECTORS:
+                    sprite = pygame.Surface((abs(dx) * tile_size + 2 * width, abs(dy) * tile_size + 2 * width), pygame.SRCALPHA)
+                    anchor = (width + (tile_size if dx < 0 else 0), width + (tile_size if dy < 0 else 0))
+                    pygame.draw.line(sprite, color, anchor, (anchor[0] + dx * tile_size, anchor[1] + dy * tile_size), width)
+                    lines[(dx, dy)] = (sprite, anchor)
+                segments.append(lines)
+            visited = pygame.Surface((tile_size, tile_size), pygame.SRCALPHA)
+            visited.fill((*COLOR_PATH_TRACK_VISITED[:3], 50))  # Very light overlay
+            atlas = cls._atlases[tile_size] = (dots, segments, visited)
+        return atlas
     
     def draw(self, surface, tile_size, offset_x, offset_y):
-        """Draw the path tracking visualization"""
-        # Draw predicted path (green)
-        for i, (x, y) in enumerate(self.predicted_path):
-            # Calculate position on screen
-            screen_x = offset_x + x * tile_size + tile_size // 2
-            screen_y = offset_y + y * tile_size + tile_size // 2
+        """Draw the path tracking visualization
+        
+        Everything lives on an overlay that is only redrawn when the prediction
+        changes and only added to as the player moves on, so a frame usually
+        costs one blit.
+        """
+        predicted_path = self.predicted_path # May be swapped by the preview worker mid-frame
+        dots, segments, visited = self.path_atlas(tile_size)
+        
+        if (self.overlay is None or self.overlay_path is not predicted_path or self.overlay_tile != tile_size
+                or self.overlay_run is not self.current_path):
+            span = self.map.size * tile_size
+            self.overlay = pygame.Surface((span, span), pygame.SRCALPHA)
+            self.overlay_path, self.overlay_tile = predicted_path, tile_size
+            self.overlay_run, self.overlay_steps = self.current_path, 0
+            self.overlay_visited = bytearray(len(self.map.cells))
             
-            # Draw a circle for each predicted position
+            # Draw predicted path (green): a dot per position and a segment from the one before
             radius = tile_size // 6
-            color = COLOR_PATH_TRACK
-            
-            # Make the path gradient (darker at start, lighter at end)
-            if len(self.predicted_path) > 1:
-                intensity = i / len(self.predicted_path)
-                r = int(50 + 150 * intensity)
-                g = int(200 + 55 * intensity)
-                b = 50
-                color = (r, g, b, 150)
-            
-            # Create a temporary surface for alpha blending
-            circle_surf = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
-            pygame.draw.circle(circle_surf, color, (radius, radius), radius)
-            surface.blit(circle_surf, (screen_x - radius, screen_y - radius))
-            
-            # Draw connecting lines between consecutive points
-            if i > 0:
-                prev_x, prev_y = self.predicted_path[i-1]
-                prev_screen_x = offset_x + prev_x * tile_size + tile_size // 2
-                prev_screen_y = offset_y + prev_y * tile_size + tile_size // 2
-                
-                # Draw line with gradient
-                line_surf = pygame.Surface((tile_size * 2, tile_size * 2), pygame.SRCALPHA)
-                pygame.draw.line(line_surf, color, 
-                               (tile_size, tile_size),
-                               (tile_size + (screen_x - prev_screen_x), tile_size + (screen_y - prev_screen_y)), 
-                               max(2, tile_size // 8))
-                surface.blit(line_surf, (prev_screen_x - tile_size, prev_screen_y - tile_size))
-        
-        # Draw visited cells (lighter green)
-        for (x, y) in self.visited_cells:
-            screen_x = offset_x + x * tile_size
-            screen_y = offset_y + y * tile_size
-            
-            # Create a semi-transparent overlay for visited cells
-            visited_surf = pygame.Surface((tile_size, tile_size), pygame.SRCALPHA)
-            visited_surf.fill((*COLOR_PATH_TRACK_VISITED[:3], 50))  # Very light overlay
-            surface.blit(visited_surf, (screen_x, screen_y))
-            
-            # Draw a small marker in visited cells
-            center_x = screen_x + tile_size // 2
-            center_y = screen_y + tile_size // 2
-            marker_size = tile_size // 8
-            pygame.draw.circle(surface, COLOR_PATH_TRACK_VISITED[:3], 
-                             (center_x, center_y), marker_size)
-        
-        # Draw current path (if player is moving)
-        for i in range(1, len(self.current_path)):
-            x1, y1 = self.current_path[i-1]
-            x2, y2 = self.current_path[i]
-            
-            screen_x1 = offset_x + x1 * tile_size + tile_size // 2
-            screen_y1 = offset_y + y1 * tile_size + tile_size // 2
-            screen_x2 = offset_x + x2 * tile_size + tile_size // 2
-            screen_y2 = offset_y + y2 * tile_size + tile_size // 2
-            
-            # Draw line for actual path taken
-            pygame.draw.line(surface, (255, 255, 100, 200), 
-                           (screen_x1, screen_y1), (screen_x2, screen_y2), 
-                           max(3, tile_size // 6))
+            steps = len(predicted_path)
+            for i, (x, y) in enumerate(predicted_path):
+                step = i * PATH_GRADIENT_STEPS // steps
+                center_x = x * tile_size + tile_size // 2
+                center_y = y * tile_size + tile_size // 2
+                self.overlay.blit(dots[step], (center_x - radius, center_y - radius))
+                if i > 0:
+                    prev_x, prev_y = predicted_path[i - 1]
+                    sprite, (anchor_x, anchor_y) = segments[step][(x - prev_x, y - prev_y)]
+                    self.overlay.blit(sprite, (prev_x * tile_size + tile_size // 2 - anchor_x,
+                                               prev_y * tile_size + tile_size // 2 - anchor_y))
+        
+        # Add the cells the player reached since the last frame
+        run = self.overlay_run
+        if self.overlay_steps < len(run):
+            half = tile_size // 2
+            for i in range(self.overlay_steps, len(run)):
+                x, y = self.map.cell_pos(run[i])
+                if not self.overlay_visited[run[i]]:
+                    # Draw visited cells (lighter green) with a small marker
+                    self.overlay_visited[run[i]] = 1
+                    self.overlay.blit(visited, (x * tile_size, y * tile_size))
+                    pygame.draw.circle(self.overlay, COLOR_PATH_TRACK_VISITED[:3],
+                                       (x * tile_size + half, y * tile_size + half), tile_size // 8)
+                if i > 0:
+                    # Draw line for actual path taken
+                    prev_x, prev_y = self.map.cell_pos(run[i - 1])
+                    pygame.draw.line(self.overlay, (255, 255, 100),
+                                     (prev_x * tile_size + half, prev_y * tile_size + half),
+                                     (x * tile_size + half, y * tile_size + half), max(3, tile_size // 6))
+            self.overlay_steps = len(run)
+        
+        surface.blit(self.overlay, (offset_x, offset_y))
+class SurfaceCache:
+    """Bounded LRU cache of rendered surfaces"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+    
+    def get(self, key, render):
+        """The surface stored for key, drawn by render() on a miss"""
+        surf = self.surfaces.get(key)
+        if surf is None:
+            surf = self.surfaces[key] = render()
+            while len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surf
 class TextEditor:
     def __init__(self, x, y, width, height, font):
         self.rect = pygame.Rect(x, y, width, height)
         self.font = font
+        # Rendering caches; a line is cached by its text, so an edited line simply misses
+        self.tokens = SurfaceCache(EDITOR_TOKEN_CACHE_SIZE) # (text, colour) -> Surface
+        self.line_surfaces = SurfaceCache(EDITOR_LINE_CACHE_SIZE) # line -> highlighted Surface
+        self.gutter = None # (first line, end line, Surface) of the line numbers last drawn
         self.lines = ["move()"]
         self.cursor_row = 0
         self.cursor_col = 6
@@ -799,7 +1573,7 @@ class TextEditor:
             if i == self.suggestion_index:
                 pygame.draw.rect(surface, (50, 50, 50), (cx + 1, cy + 2 + i*20, box_w - 2, 20))
             
-            surf = self.font.render(sugg, True, color)
+            surf = self.render_token(sugg, color)
             surface.blit(surf, (cx + 5, cy + 2 + i*20))
     
     def draw(self, surface):
@@ -831,28 +1605,16 @@ class TextEditor:
                 
                 pygame.draw.rect(surface, COLOR_SELECTION, (x_start + p_start, y, p_width, self.line_height))
         
+        # Line Numbers
+        if self.gutter is None or self.gutter[:2] != (start_line, end_line):
+            self.gutter = (start_line, end_line, self.render_gutter(start_line, end_line))
+        surface.blit(self.gutter[2], (self.rect.left + 5, self.rect.top + 5))
+        
         # Draw Text
         for i in range(start_line, end_line):
             line = self.lines[i]
             y = self.rect.top + 5 + (i - start_line) * self.line_height
-            
-            # Line Number
-            num_surf = self.font.render(str(i+1), True, COLOR_EDITOR_LINE_NUM)
-            surface.blit(num_surf, (self.rect.left + 5, y))
-            
-            # Syntax Highlighting (Simple)
-            x = self.rect.left + 40
-            
-            # Comments
-            if '#' in line:
-                code_part, comment_part = line.split('#', 1)
-                self.draw_syntax_line(surface, code_part, x, y)
-                x += self.font.size(code_part)[0]
-                
-                comm_surf = self.font.render('#' + comment_part, True, COLOR_COMMENT)
-                surface.blit(comm_surf, (x, y))
-            else:
-                self.draw_syntax_line(surface, line, x, y)
+            surface.blit(self.render_line(line), (self.rect.left + 40, y))
             
             # Cursor
             if i == self.cursor_row and pygame.time.get_ticks() % 1000 < 500:
@@ -873,49 +1635,241 @@ class TextEditor:
         
         self.draw_suggestions(surface)
     
-    def draw_syntax_line(self, surface, text, x, y):
+    def render_token(self, text, color):
+        return self.tokens.get((text, color), lambda: self.font.render(text, True, color))
+    
+    def render_gutter(self, start_line, end_line):
+        """Line numbers start_line + 1 to end_line, one per line height, on a transparent strip"""
+        numbers = [self.render_token(str(i + 1), COLOR_EDITOR_LINE_NUM) for i in range(start_line, end_line)]
+        strip = pygame.Surface((max([0] + [num.get_width() for num in numbers]), max(1, len(numbers) * self.line_height)),
+                               pygame.SRCALPHA)
+        for row, num in enumerate(numbers):
+            strip.blit(num, (0, row * self.line_height), special_flags=pygame.BLEND_RGBA_MAX) # Copy, don't blend
+        return strip
+    
+    def render_line(self, line):
+        """The line with syntax highlighting on a transparent surface, cached by its text"""
+        return self.line_surfaces.get(line, lambda: self.compose_line(line))
+    
+    def compose_line(self, line):
+        # Syntax Highlighting (Simple): (surface, x) pieces, then copied onto one surface
+        pieces = []
+        # Comments
+        if '#' in line:
+            code_part, comment_part = line.split('#', 1)
+            self.layout_syntax_line(code_part, pieces)
+            pieces.append((self.render_token('#' + comment_part, COLOR_COMMENT), self.font.size(code_part)[0]))
+        else:
+            self.layout_syntax_line(line, pieces)
+        width = max(x + piece.get_width() for piece, x in pieces)
+        height = max(piece.get_height() for piece, x in pieces)
+        surf = pygame.Surface((width, height), pygame.SRCALPHA)
+        for piece, x in pieces:
+            surf.blit(piece, (x, 0), special_flags=pygame.BLEND_RGBA_MAX) # Pieces never overlap: copy, don't blend
+        return surf
+    
+    def layout_syntax_line(self, text, pieces):
         keywords = ['move', 'turn_left', 'turn_right', 'range', 'for', 'in', 'def', 'if', 'else']
         
         # Very basic tokenizer
         words = text.split(' ')
-        curr_x = x
+        curr_x = 0
         for i, word in enumerate(words):
             clean_word = word.strip('():')
             color = COLOR_TEXT
             if clean_word in keywords:
                 color = COLOR_KEYWORD
             
-            surf = self.font.render(word, True, color)
-            surface.blit(surf, (curr_x, y))
+            surf = self.render_token(word, color)
+            pieces.append((surf, curr_x))
             curr_x += surf.get_width()
             if i < len(words) - 1:
-                space = self.font.render(' ', True, COLOR_TEXT)
-                surface.blit(space, (curr_x, y))
+                space = self.render_token(' ', COLOR_TEXT)
+                pieces.append((space, curr_x))
                 curr_x += space.get_width()
 class GameMap:
-    def __init__(self, size=10):
+    _ids = itertools.count(1)
+    
+    def __init__(self, size=10, seed=None, generate=True):
         self.size = size
-        # 0 = Floor, 1 = Wall
-        self.grid = []
+        self.map_id = next(GameMap._ids) # Identity for caches
+        # Each map draws from its own generator, so a seed always gives the same maze
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.version = 0 # Bumped whenever the layout, keys or doors change
+        self.layout_version = 0 # Version of the last whole-map change, see changes_since
+        self.changes = [] # (version, pos) of every single-cell change after that
+        # Row-major CELL_* values with a one-cell wall border, so neighbours never need bounds checks
+        self.stride = size + 2
+        self.cells = bytearray()
+        self._distance_fields = {} # (source, through_doors) -> (distance, parent), see distance_field
         self.start_pos = (1, 1)
         self.goal_pos = (size - 2, size - 2)
         self.keys = [] # List of positions
         self.doors = [] # List of positions
-        self.generate_maze()
+        self._layer = None # (Surface, tile_size, version) the maze was last rendered at, see draw
+        if generate:
+            self.generate_maze()
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_layer'] = None # Surfaces do not pickle; the maze is rendered again where it is drawn
+        return state
     
     def generate_maze(self, num_doors=0):
+        # A key can end up behind the door it opens; try other layouts, then fewer doors (0 always works)
+        for doors in range(num_doors, -1, -1):
+            for _ in range(MAZE_ATTEMPTS):
+                if self.carve_layout(doors):
+                    return
+    
+    def carve_layout(self, num_doors):
+        """Carve a new maze with num_doors doors and their keys; returns whether it can be solved"""
+        self.version += 1
+        self.layout_version = self.version
+        self.changes = []
+        self._distance_fields.clear()
+        size, stride, rng = self.size, self.stride, self.rng
+        origin = stride + 1
         # Initialize with walls
-        self.grid = [[1 for _ in range(self.size)] for _ in range(self.size)]
+        self.cells = cells = bytearray([CELL_WALL]) * (stride * stride)
+        
+        if size >= STREAMING_MAZE_SIZE:
+            # Eller's algorithm keeps one row of state instead of a visited set and stack of every cell
+            # (mazegen rows use the CELL_FLOOR and CELL_WALL values)
+            for y, row in enumerate(mazegen.eller_rows(size, rng)):
+                start = (y + 1) * stride + 1
+                cells[start:start + size] = row
+        else:
+            self.carve_backtracker()
         
-        # Recursive Backtracker
-        cells = []
-        for y in range(1, self.size - 1, 2):
-            for x in range(1, self.size - 1, 2):
-                cells.append((x, y))
+        # Ensure Goal is reachable
+        gx, gy = size - 2, size - 2
+        self.goal_pos = (gx, gy)
+        goal = gy * stride + gx + origin
+        cells[goal] = CELL_FLOOR
         
+        if cells[goal - 1] == CELL_WALL and cells[goal - stride] == CELL_WALL:
+             cells[goal - 1] = CELL_FLOOR
+        
+        # Add random loops ONLY if no doors (Strict Requirement)
+        if num_doors == 0:
+            for _ in range(size // 2):
+                rx = rng.randint(1, size - 2)
+                ry = rng.randint(1, size - 2)
+                cell = ry * stride + rx + origin
+                if cells[cell] == CELL_WALL:
+                    floors = 0
+                    for step in (-stride, 1, stride, -1):
+                        if cells[cell + step] == CELL_FLOOR:
+                            floors += 1
+                    if floors >= 2:
+                        cells[cell] = CELL_FLOOR
+        
+        # Place Keys and Doors
+        self.keys = []
+        self.doors = []
+        solvable = self.place_doors(num_doors) if num_doors > 0 else True
+        
+        for pos in [self.goal_pos] + self.keys + self.doors:
+            self.refresh_cell(pos)
+        
+        return not self.doors or solvable or self.is_solvable()
+    
+    def place_doors(self, num_doors):
+        """Put doors along the path to the goal, each with a key far out in the part of the maze before it
+        
+        Returns True when every key is known to be reachable before its door,
+        and False when the layout still needs checking with is_solvable.
+        
+        Doors only go into mazes without loops, so the search from the start is
+        a tree and the doors cut it into regions: a key goes into the cells
+        hanging off the path between the previous door and its own. The regions
+        are cut from that one search rather than searched again for each door.
+        """
+        rng, stride = self.rng, self.stride
+        start, goal = self.cell_index(self.start_pos), self.cell_index(self.goal_pos)
+        order, distance, parent = gridsearch.search(self.wall_cells(), stride, start)
+        if distance[goal] < 0:
+            return False
+        path = [goal]
+        while path[-1] != start:
+            path.append(parent[path[-1]])
+        path.reverse()
+        if len(path) <= num_doors * 5:
+            return True
+        
+        indices = []
+        for i in range(num_doors):
+            segment_len = len(path) // (num_doors + 1)
+            base_idx = segment_len * (i + 1)
+            idx = base_idx + rng.randint(-2, 2)
+            idx = max(5, min(len(path) - 5, idx))
+            indices.append(idx)
+        indices.sort()
+        
+        # Index of the path cell every cell hangs off
+        attach = [-1] * len(distance)
+        for j, cell in enumerate(path):
+            attach[cell] = j
+        for cell in order:
+            if attach[cell] < 0:
+                attach[cell] = attach[parent[cell]]
+        # Path indices [first, end) reachable from just past the previous door with the doors so far closed
+        spans = []
+        for i, idx in enumerate(indices):
+            first = indices[i - 1] + 1 if i else 0
+            spans.append((first, min([placed for placed in indices[:i + 1] if placed >= first], default=len(path))))
+        hanging = [[i for i, (first, end) in enumerate(spans) if first <= j < end] for j in range(len(path))]
+        regions = [[] for _ in indices] # Breadth-first order from the start is also the order from each region's first cell
+        for cell in order:
+            for i in hanging[attach[cell]]:
+                regions[i].append(cell)
+        
+        solvable = True
+        for i, idx in enumerate(indices):
+            door_pos = self.cell_pos(path[idx])
+            self.doors.append(door_pos)
+            self.refresh_cell(door_pos)
+            
+            first, end = spans[i]
+            if first < end:
+                reachable, reach_distance = regions[i], distance
+            else: # Doors next to each other: the robot starts on a closed door, search from there
+                doors = [self.cell_index(pos) for pos in self.doors]
+                reachable, reach_distance, _ = gridsearch.search(self.wall_cells(), stride, path[first], blocked=(doors,))
+            candidates = [cell for cell in reachable if self.cells[cell] == CELL_FLOOR and cell != start
+                          and not (attach[cell] < idx and path[attach[cell]] == cell)]
+            
+            if candidates:
+                # Cells come nearest first, so the farthest quarter is the last few distance groups, each kept in order
+                top_n = max(1, len(candidates) // 4)
+                farthest = []
+                group_end = len(candidates)
+                while len(farthest) < top_n:
+                    group = group_end - 1
+                    while group > 0 and reach_distance[candidates[group - 1]] == reach_distance[candidates[group_end - 1]]:
+                        group -= 1
+                    farthest.extend(candidates[group:group_end])
+                    group_end = group
+                key = rng.choice(farthest[:top_n])
+            else: # Only the path before the door is left; never the start or a cell that already holds an item
+                spare = [cell for cell in reachable if self.cells[cell] == CELL_FLOOR and cell != start]
+                key = rng.choice(spare) if spare else None # No key at all fails is_solvable, so the layout is redone
+            if key is not None:
+                self.keys.append(self.cell_pos(key))
+                self.refresh_cell(self.cell_pos(key))
+            # Known reachable only with the door right after its key's region and a free cell for the key
+            solvable = solvable and end == idx and bool(candidates)
+        return solvable
+    
+    def carve_backtracker(self):
+        """Carve a perfect maze into the all-wall cells with a recursive backtracker"""
+        size, stride, rng, cells = self.size, self.stride, self.rng, self.cells
+        origin = stride + 1
         stack = []
         start = (1, 1)
-        self.grid[start[1]][start[0]] = 0
+        cells[start[1] * stride + start[0] + origin] = CELL_FLOOR
         stack.append(start)
         
         visited = {start}
@@ -926,156 +1880,276 @@ class GameMap:
             
             for dx, dy in [(0, -2), (2, 0), (0, 2), (-2, 0)]:
                 nx, ny = cx + dx, cy + dy
-                if 1 <= nx < self.size - 1 and 1 <= ny < self.size - 1:
+                if 1 <= nx < size - 1 and 1 <= ny < size - 1:
                     if (nx, ny) not in visited:
                         neighbors.append((nx, ny))
             
             if neighbors:
-                nx, ny = random.choice(neighbors)
+                nx, ny = rng.choice(neighbors)
                 wx, wy = cx + (nx - cx) // 2, cy + (ny - cy) // 2
-                self.grid[wy][wx] = 0
-                self.grid[ny][nx] = 0
+                cells[wy * stride + wx + origin] = CELL_FLOOR
+                cells[ny * stride + nx + origin] = CELL_FLOOR
                 visited.add((nx, ny))
                 stack.append((nx, ny))
             else:
                 stack.pop()
-        
-        # Ensure Goal is reachable
-        gx, gy = self.size - 2, self.size - 2
-        self.goal_pos = (gx, gy)
-        self.grid[gy][gx] = 0
-        
-        if self.grid[gy][gx-1] == 1 and self.grid[gy-1][gx] == 1:
-             self.grid[gy][gx-1] = 0
-        
-        # Add random loops ONLY if no doors (Strict Requirement)
-        if num_doors == 0:
-            for _ in range(self.size // 2):
-                rx = random.randint(1, self.size - 2)
-                ry = random.randint(1, self.size - 2)
-                if self.grid[ry][rx] == 1:
-                    floors = 0
-                    for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
-                        if self.grid[ry+dy][rx+dx] == 0:
-                            floors += 1
-                    if floors >= 2:
-                        self.grid[ry][rx] = 0
-        
-        # Place Keys and Doors
-        self.keys = []
-        self.doors = []
-        
-        if num_doors > 0:
-            path = self.find_path(self.start_pos, self.goal_pos)
-            if path and len(path) > (num_doors * 5):
-                indices = []
-                for i in range(num_doors):
-                    segment_len = len(path) // (num_doors + 1)
-                    base_idx = segment_len * (i + 1)
-                    idx = base_idx + random.randint(-2, 2)
-                    idx = max(5, min(len(path) - 5, idx))
-                    indices.append(idx)
-                
-                indices.sort()
-                
-                current_start = self.start_pos
-                
-                for i, idx in enumerate(indices):
-                    door_pos = path[idx]
-                    self.doors.append(door_pos)
-                    
-                    block_list = self.doors[:] 
-                    reachable_dists = self.get_reachable_distances(current_start, block_list=block_list)
-                    
-                    candidates = []
-                    path_segment_set = set(path[:idx])
-                    
-                    for pos, dist in reachable_dists.items():
-                        if pos not in path_segment_set and pos not in self.keys and pos not in self.doors and pos != self.start_pos:
-                            candidates.append((pos, dist))
-                    
-                    candidates.sort(key=lambda x: x[1], reverse=True)
-                    
-                    if candidates:
-                        top_n = max(1, len(candidates) // 4)
-                        key_pos = random.choice(candidates[:top_n])[0]
-                        self.keys.append(key_pos)
-                    else:
-                        if reachable_dists:
-                            self.keys.append(random.choice(list(reachable_dists.keys())))
-                        else:
-                            self.keys.append(path[idx-1])
-                    
-                    if idx + 1 < len(path):
-                        current_start = path[idx+1]
+    
+    @property
+    def grid(self):
+        """Compatibility view: grid[y][x] is the CELL_* value of (x, y), rows are live memoryviews of cells"""
+        view = memoryview(self.cells)
+        rows = range(self.stride + 1, self.stride * (self.size + 1), self.stride)
+        return [view[start:start + self.size] for start in rows]
+    
+    def cell_index(self, pos):
+        """Index of (x, y) in cells"""
+        return (pos[1] + 1) * self.stride + pos[0] + 1
+    
+    def cell_pos(self, index):
+        y, x = divmod(index, self.stride)
+        return (x - 1, y - 1)
+    
+    def cell_at(self, pos):
+        """CELL_* value of (x, y): what is in that cell, in O(1)"""
+        return self.cells[(pos[1] + 1) * self.stride + pos[0] + 1]
+    
+    def changes_since(self, version):
+        """Positions whose cell changed after version, or None when the whole map has been replaced since"""
+        if version < self.layout_version:
+            return None
+        return {pos for changed, pos in self.changes if changed > version}
+    
+    def refresh_cell(self, pos):
+        """Recompute the cell type of a floor cell from the goal, keys and doors"""
+        if pos == self.goal_pos: cell = CELL_GOAL
+        elif pos in self.keys: cell = CELL_KEY
+        elif pos in self.doors: cell = CELL_DOOR
+        else: cell = CELL_FLOOR
+        self.cells[self.cell_index(pos)] = cell
+    
+    def wall_cells(self):
+        """Copy of cells with walls as 1 and everything else as 0, for gridsearch"""
+        return self.cells.translate(WALL_TABLE)
+    
+    def wall_rows(self):
+        """1 for every wall and 0 for every other cell, row by row without the border"""
+        walls = self.wall_cells()
+        rows = range(self.stride + 1, self.stride * (self.size + 1), self.stride)
+        return b''.join(walls[start:start + self.size] for start in rows)
+    
+    def set_layout(self, walls, goal_pos, keys, doors):
+        """Replace the maze with a stored one; walls is laid out like wall_rows() (CELL_WALL or CELL_FLOOR)"""
+        self.version += 1
+        self.layout_version = self.version
+        self.changes = []
+        self._distance_fields.clear()
+        self.cells = bytearray([CELL_WALL]) * (self.stride * self.stride)
+        for y in range(self.size):
+            start = (y + 1) * self.stride + 1
+            self.cells[start:start + self.size] = walls[y * self.size:(y + 1) * self.size]
+        self.goal_pos = goal_pos
+        self.keys = list(keys)
+        self.doors = list(doors)
+        for pos in [self.goal_pos] + self.keys + self.doors:
+            self.refresh_cell(pos)
+    
+    def is_solvable(self):
+        """Whether the goal can be reached, picking up keys to unlock the doors in the way"""
+        return solver.solvable(self.wall_cells(), self.stride, self.cell_index(self.start_pos),
+                               self.cell_index(self.goal_pos), [self.cell_index(pos) for pos in self.keys],
+                               [self.cell_index(pos) for pos in self.doors])
+    
+    def optimal_lines(self):
+        """Fewest lines of move/turn code from the start to the goal, fetching keys for the doors on the way"""
+        solution = solver.solve(self.wall_cells(), self.stride, self.cell_index(self.start_pos), 1,
+                                self.cell_index(self.goal_pos), [self.cell_index(pos) for pos in self.keys],
+                                [self.cell_index(pos) for pos in self.doors])
+        return solution[0] if solution else 999
+    
+    def distance_field(self, source=None, through_doors=False):
+        """BFS from source (default: the goal) to every cell, as (distance, parent) arrays indexed like cells
+        
+        distance is -1 where unreachable; parent is the previous cell on a
+        shortest path from source. Locked doors block unless through_doors.
+        Fields from the start and goal are cached until the layout or the
+        doors change.
+        """
+        if source is None:
+            source = self.goal_pos
+        key = (source, through_doors)
+        field = self._distance_fields.get(key)
+        if field is None:
+            blocked = () if through_doors else ([self.cell_index(pos) for pos in self.doors],)
+            _, distance, parent = gridsearch.search(self.wall_cells(), self.stride,
+                                                    self.cell_index(source), blocked=blocked)
+            field = (array('i', distance), array('i', parent))
+            if source == self.start_pos or source == self.goal_pos:
+                self._distance_fields[key] = field
+        return field
+    
+    def distance_to_goal(self, pos):
+        """Moves from pos to the goal, walking through doors, or -1 when it cannot be reached"""
+        return self.distance_field(through_doors=True)[0][self.cell_index(pos)]
     
     def find_path(self, start, end):
-        queue = [(start, [])]
-        visited = {start}
-        while queue:
-            (cx, cy), path = queue.pop(0)
-            if (cx, cy) == end:
-                return path + [(cx, cy)]
-            
-            for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
-                nx, ny = cx + dx, cy + dy
-                if not self.is_wall(nx, ny) and (nx, ny) not in visited:
-                    visited.add((nx, ny))
-                    queue.append(((nx, ny), path + [(cx, cy)]))
-        return None
+        # Same path as a search stopping at end: BFS parents do not depend on when it stops
+        distance, parent = self.distance_field(start, through_doors=True)
+        cell = self.cell_index(end)
+        if distance[cell] < 0:
+            return None
+        path = [cell]
+        while distance[cell]:
+            cell = parent[cell]
+            path.append(cell)
+        path.reverse()
+        return [self.cell_pos(cell) for cell in path]
     
     def get_reachable_distances(self, start, block_list):
-        queue = [(start, 0)]
-        visited = {start: 0}
-        block_set = set(block_list)
-        while queue:
-            (cx, cy), dist = queue.pop(0)
-            for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
-                nx, ny = cx + dx, cy + dy
-                if not self.is_wall(nx, ny) and (nx, ny) not in block_set and (nx, ny) not in visited:
-                    visited[(nx, ny)] = dist + 1
-                    queue.append(((nx, ny), dist + 1))
-        return visited
+        blocked = [self.cell_index(pos) for pos in block_list]
+        reachable = gridsearch.distances(self.wall_cells(), self.stride,
+                                         self.cell_index(start), blocked=(blocked,))
+        return {self.cell_pos(cell): dist for cell, dist in reachable}
+    
+    def remove_key(self, pos):
+        self.keys.remove(pos)
+        self.refresh_cell(pos)
+        self.version += 1
+        self.changes.append((self.version, pos))
+    
+    def remove_door(self, pos):
+        self.doors.remove(pos)
+        self.refresh_cell(pos)
+        self.version += 1
+        self.changes.append((self.version, pos))
+        # Fields that go through doors stay valid
+        self._distance_fields = {key: field for key, field in self._distance_fields.items() if key[1]}
     
     def is_wall(self, x, y):
-        if 0 <= x < self.size and 0 <= y < self.size:
-            return self.grid[y][x] == 1
-        return True
+        # The border makes every cell next to the grid a wall; further out is not supported
+        return self.cells[(y + 1) * self.stride + x + 1] == CELL_WALL
     
     def draw(self, surface, tile_size, offset_x, offset_y):
+        """Blit the maze, rendered once per tile size and patched where keys were taken and doors opened"""
+        changed = None
+        if self._layer is not None and self._layer[1] == tile_size:
+            changed = self.changes_since(self._layer[2])
+        if changed is None:
+            span = self.size * tile_size + 1
+            layer = pygame.Surface((span, span))
+            self.render(layer, tile_size, layer.get_rect())
+        else:
+            layer = self._layer[0]
+            for x, y in changed:
+                # Key art overhangs small tiles, so the patch covers the neighbours' tiles too
+                self.render(layer, tile_size, pygame.Rect(x * tile_size - 16, y * tile_size - 16,
+                                                          tile_size + 32, tile_size + 32))
+        self._layer = (layer, tile_size, self.version)
+        surface.blit(layer, (offset_x, offset_y))
+    
+    def render(self, surface, tile_size, area):
+        """Draw the grid lines and cells onto surface, touching only the pixels in area"""
+        surface.set_clip(area)
+        surface.fill(COLOR_BG)
+        area = surface.get_clip()
+        # Cells whose art can reach into area; as in draw, key art overhangs by up to 16 pixels
+        first_x = max(0, (area.left - 16) // tile_size)
+        first_y = max(0, (area.top - 16) // tile_size)
+        last_x = min(self.size - 1, (area.right + 16) // tile_size)
+        last_y = min(self.size - 1, (area.bottom + 16) // tile_size)
+        
         # Draw Grid Lines
         for x in range(self.size + 1):
             pygame.draw.line(surface, COLOR_GRID, 
-                             (offset_x + x * tile_size, offset_y),
-                             (offset_x + x * tile_size, offset_y + self.size * tile_size))
+                             (x * tile_size, 0),
+                             (x * tile_size, self.size * tile_size))
         for y in range(self.size + 1):
             pygame.draw.line(surface, COLOR_GRID,
-                             (offset_x, offset_y + y * tile_size),
-                             (offset_x + self.size * tile_size, offset_y + y * tile_size))
+                             (0, y * tile_size),
+                             (self.size * tile_size, y * tile_size))
         
         # Draw Walls, Goal, Key, Door
-        for y in range(self.size):
-            for x in range(self.size):
-                rect = (offset_x + x * tile_size + 2, offset_y + y * tile_size + 2, 
+        for y in range(first_y, last_y + 1):
+            row = (y + 1) * self.stride + 1
+            for x in range(first_x, last_x + 1):
+                cell = self.cells[row + x]
+                if cell == CELL_FLOOR:
+                    continue
+                rect = (x * tile_size + 2, y * tile_size + 2, 
                         tile_size - 4, tile_size - 4)
                 cx = rect[0] + tile_size // 2
                 cy = rect[1] + tile_size // 2
                 
-                if self.grid[y][x] == 1:
+                if cell == CELL_WALL:
                     pygame.draw.rect(surface, COLOR_WALL, rect)
-                elif (x, y) == self.goal_pos:
+                elif cell == CELL_GOAL:
                     pygame.draw.rect(surface, COLOR_GOAL, rect, 3)
                     pygame.draw.rect(surface, COLOR_GOAL, (cx - 4, cy - 4, 8, 8))
-                elif (x, y) in self.keys:
+                elif cell == CELL_KEY:
                     # Draw Key Art
                     pygame.draw.circle(surface, COLOR_KEY, (cx, cy - 4), 6) 
                     pygame.draw.line(surface, COLOR_KEY, (cx, cy), (cx, cy + 10), 3) 
                     pygame.draw.line(surface, COLOR_KEY, (cx, cy + 10), (cx + 4, cy + 10), 3) 
-                elif (x, y) in self.doors:
+                elif cell == CELL_DOOR:
                     # Draw Door Art
                     pygame.draw.rect(surface, COLOR_DOOR, rect)
                     pygame.draw.rect(surface, (100, 50, 10), rect, 2) 
                     pygame.draw.circle(surface, (255, 215, 0), (rect[0] + tile_size - 8, cy), 3)
+        surface.set_clip(None)
+def build_level(difficulty, grid_size, seed=None):
+    """A new maze for a level of this size, with its optimal line count"""
+    game_map = GameMap(grid_size, seed)
+    game_map.generate_maze(door_count(difficulty, grid_size))
+    return game_map, game_map.optimal_lines()
+class LevelPipeline:
+    """Builds the levels the player can reach next in a worker process, so switching levels never waits on generation
+    
+    A process rather than a thread: building a 72x72 level is pure Python and
+    would hold the GIL for the frames drawn meanwhile.
+    
+    With a seed, every level is built from it (levels of a difficulty differ
+    in grid size), so everyone playing with that seed gets the same mazes, as
+    grader.py does; levels found in the optional level pack are read from it.
+    """
+    def __init__(self, seed=None, pack=None):
+        self.seed = seed # None: a random maze every time
+        self.pack = pack # levelpack.LevelPack or None
+        self.pool = None # Started on first use
+        self.pending = {} # (difficulty, grid_size) -> Future of (GameMap, optimal lines), most urgent first
+    
+    def prepare(self, levels):
+        """Build these (difficulty, grid_size) levels in the background and drop any others"""
+        levels = [level for level in levels if not self.stored(*level)] # Reading a pack is quick
+        for level in list(self.pending):
+            if level not in levels:
+                self.pending.pop(level).cancel() # A build already running just finishes unseen
+        for level in levels:
+            if level not in self.pending:
+                if self.pool is None:
+                    self.pool = concurrent.futures.ProcessPoolExecutor(1, multiprocessing.get_context("spawn"))
+                try:
+                    self.pending[level] = self.pool.submit(build_level, *level, self.seed)
+                except RuntimeError: # Broken pool; take() builds levels here instead
+                    return
+    
+    def take(self, difficulty, grid_size):
+        """The level as (GameMap, optimal lines): a prepared one, or built right here if it was not asked for"""
+        if self.stored(difficulty, grid_size):
+            game_map, optimal_lines = self.pack.get(difficulty, grid_size, self.seed)
+            game_map.map_id = next(GameMap._ids)
+            return game_map, optimal_lines
+        future = self.pending.pop((difficulty, grid_size), None)
+        if future is not None:
+            try:
+                game_map, optimal_lines = future.result() # Waits if it is still being built
+            except Exception: # The worker died; build it here instead
+                pass
+            else:
+                game_map.map_id = next(GameMap._ids) # Ids from the worker could clash with this process's
+                return game_map, optimal_lines
+        return build_level(difficulty, grid_size, self.seed)
+    
+    def stored(self, difficulty, grid_size):
+        return self.pack is not None and self.seed is not None and (difficulty, grid_size, self.seed) in self.pack
 class Player:
     def __init__(self, start_pos):
         self.reset(start_pos)
@@ -1180,94 +2254,36 @@ class Player:
         pygame.draw.polygon(surface, color, points)
 class CodeInterpreter:
     def __init__(self, console, game):
-        self.action_queue = []
+        self.action_queue = ActionStream()
         self.console = console
         self.game = game
 
     def run_code(self, code_str):
-        self.action_queue = []
+        self.stop()
         self.console.clear()
         
-        # Simulation State
-        sim_x, sim_y = self.game.player.grid_x, self.game.player.grid_y
-        sim_dir = self.game.player.direction # 0=N, 1=E, 2=S, 3=W
-        
-        lines = [l for l in code_str.split('\n') if l.strip() and not l.strip().startswith('#')]
-
-        def move(): 
-            nonlocal sim_x, sim_y
-            # Calculate next pos
-            dx, dy = 0, 0
-            if sim_dir == 0: dy = -1
-            elif sim_dir == 1: dx = 1
-            elif sim_dir == 2: dy = 1
-            elif sim_dir == 3: dx = -1
-            
-            target_x, target_y = sim_x + dx, sim_y + dy
-            # Check collision with wall using game map
-            if not self.game.map.is_wall(target_x, target_y):
-                sim_x, sim_y = target_x, target_y
-            
-            self.action_queue.append(('MOVE',))
-
-        def turn_left(): 
-            nonlocal sim_dir
-            sim_dir = (sim_dir - 1) % 4
-            self.action_queue.append(('TURN', 'LEFT'))
-
-        def turn_right(): 
-            nonlocal sim_dir
-            sim_dir = (sim_dir + 1) % 4
-            self.action_queue.append(('TURN', 'RIGHT'))
-
-        # Sensors
-        def wall_ahead():
-            dx, dy = 0, 0
-            if sim_dir == 0: dy = -1
-            elif sim_dir == 1: dx = 1
-            elif sim_dir == 2: dy = 1
-            elif sim_dir == 3: dx = -1
-            return self.game.map.is_wall(sim_x + dx, sim_y + dy)
-
-        def path_left():
-            # Check left relative to current direction
-            left_dir = (sim_dir - 1) % 4
-            dx, dy = 0, 0
-            if left_dir == 0: dy = -1
-            elif left_dir == 1: dx = 1
-            elif left_dir == 2: dy = 1
-            elif left_dir == 3: dx = -1
-            return not self.game.map.is_wall(sim_x + dx, sim_y + dy)
-
-        def path_right():
-            # Check right relative to current direction
-            right_dir = (sim_dir + 1) % 4
-            dx, dy = 0, 0
-            if right_dir == 0: dy = -1
-            if right_dir == 1: dx = 1
-            elif right_dir == 2: dy = 1
-            elif right_dir == 3: dx = -1
-            return not self.game.map.is_wall(sim_x + dx, sim_y + dy)
-
-        env = {
-            'move': move,
-            'turn_left': turn_left,
-            'turn_right': turn_right,
-            'wall_ahead': wall_ahead,
-            'path_left': path_left,
-            'path_right': path_right,
-            'range': range,
-            'print': lambda x: self.console.log(str(x))
-        }
-        try:
-            exec(code_str, {"__builtins__": {}}, env)
-            self.console.log("Execution successful.", COLOR_SUCCESS)
-            return True
-        except Exception as e:
-            self.console.log(f"Runtime Error: {str(e)}", COLOR_ERROR)
+        # Simulate from where the run will start, to the end, before anything moves or is charged;
+        # a finished preview of the same code is reused
+        result = simulate_program(code_str, self.game.map, self.game.map.start_pos, 1,
+                                  self.game.program_cache, deadline_ms=SIM_RUN_DEADLINE_MS)
+        self.report(result)
+        if not result.ok:
             return False
+        self.action_queue = ActionStream(result.actions)
+        return True
+    
+    def report(self, result):
+        for text in result.output:
+            self.console.log(text)
+        if result.ok:
+            self.console.log("Execution successful.", COLOR_SUCCESS)
+        else:
+            self.console.log(f"Runtime Error: {result.error}", COLOR_ERROR)
+    
+    def stop(self):
+        self.action_queue.close()
 class Game:
-    def __init__(self):
+    def __init__(self, seed=None, pack=None):
         pygame.init()
         
         # Initialize fullscreen mode
@@ -1289,14 +2305,19 @@ class Game:
         self.map = GameMap(self.grid_size)
         self.player = Player(self.map.start_pos)
         
+        # Compiled programs and simulation results shared by live preview and RUN
+        self.program_cache = ProgramCache()
+        self.preview_worker = PreviewWorker(self.program_cache)
+        self.level_pipeline = LevelPipeline(seed, pack) # Maze seed and level pack, see LevelPipeline
+        
         # Initialize path tracker
-        self.path_tracker = PathTracker(self.map)
+        self.path_tracker = PathTracker(self.map, self.program_cache)
         self.last_code_hash = None
         
         # UI Components
         BUTTON_AREA_HEIGHT = 80 # Increased for 2 rows
         self.editor = TextEditor(GAME_VIEW_WIDTH, 0, EDITOR_WIDTH, SCREEN_HEIGHT - 200 - BUTTON_AREA_HEIGHT, self.font)
-        self.console = Console(GAME_VIEW_WIDTH, SCREEN_HEIGHT - 200, EDITOR_WIDTH, 200, self.font)
+        self.console = Console(GAME_VIEW_WIDTH, SCREEN_HEIGHT - 200, EDITOR_WIDTH, 200, self.font, CONSOLE_HISTORY_FILE)
         self.interpreter = CodeInterpreter(self.console, self)
         
         # Buttons
@@ -1359,6 +2380,7 @@ class Game:
         self.current_run_cost = 0
         
         self.optimal_lines = self.calculate_optimal_lines()
+        self.prepare_levels()
         
         # Timer for live code analysis
         self.last_live_update = 0
@@ -1461,37 +2483,20 @@ class Game:
     
     def set_difficulty(self, diff):
         self.difficulty = diff
-        if diff == "NORMAL":
-            self.grid_size = 10
-            self.line_cost = 10
-        elif diff == "HARD":
-            self.grid_size = 16
-            self.line_cost = 15
-        elif diff == "EXTREME":
-            self.grid_size = 24
-            self.line_cost = 20
+        if diff in DIFFICULTY_GRID_SIZES:
+            self.grid_size = DIFFICULTY_GRID_SIZES[diff]
+            self.line_cost = DIFFICULTY_LINE_COSTS[diff]
         
         self.calculate_layout()
         self.level = 1
         self.coins = STARTING_COINS
         self.level_start_coins = STARTING_COINS
         
-        # Determine num_doors
-        num_doors = 0
-        if diff == "EXTREME":
-            if self.grid_size >= 72: num_doors = 5
-            elif self.grid_size >= 64: num_doors = 4
-            elif self.grid_size >= 32: num_doors = 3
-            else: num_doors = 2
-        elif self.grid_size >= 16: # Normal/Hard threshold
-             num_doors = 1
-            
-        self.map = GameMap(self.grid_size)
-        self.map.generate_maze(num_doors)
+        self.map, self.optimal_lines = self.level_pipeline.take(diff, self.grid_size)
         
         self.player = Player(self.map.start_pos)
-        self.path_tracker = PathTracker(self.map)
-        self.optimal_lines = self.calculate_optimal_lines()
+        self.preview_worker.cancel() # Previews of the last level's tracker
+        self.path_tracker = PathTracker(self.map, self.program_cache)
         
         # Dynamic Starting Coins
         # Ensure coins exactly match goal lines cost
@@ -1501,6 +2506,7 @@ class Game:
         self.level_start_coins = self.coins
         
         self.state = "EDITING"
+        self.prepare_levels()
         self.editor.lines = ["move()"]
         self.editor.cursor_row = 0
         self.editor.cursor_col = 6
@@ -1520,46 +2526,22 @@ class Game:
         self.console.log(f"Level Complete! Reward: {reward} Coins.", COLOR_SUCCESS)
         
         # Scale Difficulty (Size)
-        if self.difficulty == "EXTREME":
-            # 24 -> 32 -> 48 -> 64 -> 72
-            if self.grid_size == 24: self.grid_size = 32
-            elif self.grid_size == 32: self.grid_size = 48
-            elif self.grid_size == 48: self.grid_size = 64
-            elif self.grid_size == 64: self.grid_size = 72
-            elif self.grid_size == 72:
-                self.state = "YOU_WON" # Win Condition
-                return
-        else:
-            # Normal / Hard Scaling
-            if self.difficulty == "NORMAL" and self.grid_size >= 32:
-                self.state = "YOU_WON"
-                return
-            elif self.difficulty == "HARD" and self.grid_size >= 50:
-                self.state = "YOU_WON"
-                return
-                
-            if self.grid_size < 72:
-                self.grid_size += 2
-            
+        grid_size = next_grid_size(self.difficulty, self.grid_size)
+        if grid_size is None:
+            self.state = "YOU_WON" # Win Condition
+            self.level_pipeline.prepare([])
+            return
+        self.grid_size = grid_size
+        
         self.calculate_layout()
         self.console.log(f"Map Size Increased to {self.grid_size}x{self.grid_size}!", COLOR_KEYWORD)
         
-        # Determine num_doors for Extreme
-        num_doors = 0
-        if self.difficulty == "EXTREME":
-            if self.grid_size >= 72: num_doors = 5
-            elif self.grid_size >= 64: num_doors = 4
-            elif self.grid_size >= 32: num_doors = 3
-            else: num_doors = 2
-        elif self.grid_size >= 16: # Normal/Hard threshold
-             num_doors = 1
-        
-        self.map = GameMap(self.grid_size) # Regenerate with current size
-        self.map.generate_maze(num_doors)
+        self.map, self.optimal_lines = self.level_pipeline.take(self.difficulty, self.grid_size)
         self.player.reset(self.map.start_pos)
-        self.path_tracker = PathTracker(self.map)
+        self.preview_worker.cancel() # Previews of the last level's tracker
+        self.path_tracker = PathTracker(self.map, self.program_cache)
         self.state = "EDITING"
-        self.optimal_lines = self.calculate_optimal_lines()
+        self.prepare_levels()
         self.current_run_cost = 0
         
         # Ensure sufficient coins for next level
@@ -1580,74 +2562,32 @@ class Game:
         self.editor.update_scrollbar()
         self.console.log(f"Level {self.level} Started!", COLOR_SUCCESS)
     
-    def calculate_optimal_lines(self):
-        # BFS to find shortest path
-        queue = [(self.map.start_pos, [])]
-        visited = {self.map.start_pos}
-        path = []
-        
-        while queue:
-            (curr_x, curr_y), curr_path = queue.pop(0)
-            if (curr_x, curr_y) == self.map.goal_pos:
-                path = curr_path + [(curr_x, curr_y)]
+    def prepare_levels(self):
+        # Level 1 of every difficulty from the menu, the next levels of this one while playing
+        if self.state == "MENU":
+            self.level_pipeline.prepare(DIFFICULTY_GRID_SIZES.items())
+            return
+        upcoming = []
+        grid_size = self.grid_size
+        for _ in range(LEVEL_PIPELINE_DEPTH):
+            grid_size = next_grid_size(self.difficulty, grid_size)
+            if grid_size is None:
                 break
-            
-            for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
-                next_x, next_y = curr_x + dx, curr_y + dy
-                if not self.map.is_wall(next_x, next_y) and (next_x, next_y) not in visited:
-                    visited.add((next_x, next_y))
-                    queue.append(((next_x, next_y), curr_path + [(curr_x, curr_y)]))
-        
-        if not path: return 999
-        curr_dir = 1 
-        lines = 0
-        i = 0
-        while i < len(path) - 1:
-            curr_node = path[i]
-            next_node = path[i+1]
-            dx = next_node[0] - curr_node[0]
-            dy = next_node[1] - curr_node[1]
-            
-            target_dir = -1
-            if dy == -1: target_dir = 0
-            elif dx == 1: target_dir = 1
-            elif dy == 1: target_dir = 2
-            elif dx == -1: target_dir = 3
-            
-            diff = (target_dir - curr_dir) % 4
-            if diff == 1: lines += 1
-            elif diff == 2: lines += 2
-            elif diff == 3: lines += 1
-            
-            curr_dir = target_dir
-            moves = 0
-            while i < len(path) - 1:
-                n1 = path[i]
-                n2 = path[i+1]
-                dx2 = n2[0] - n1[0]
-                dy2 = n2[1] - n1[1]
-                move_dir = -1
-                if dy2 == -1: move_dir = 0
-                elif dx2 == 1: move_dir = 1
-                elif dy2 == 1: move_dir = 2
-                elif dx2 == -1: move_dir = 3
-                
-                if move_dir == curr_dir:
-                    moves += 1
-                    i += 1
-                else:
-                    break
-            
-            if moves == 1: lines += 1
-            elif moves > 1: lines += 2
-                
-        return lines
+            upcoming.append((self.difficulty, grid_size))
+        self.level_pipeline.prepare(upcoming)
+    
+    def calculate_optimal_lines(self):
+        return self.map.optimal_lines()
+    
+    def quit(self):
+        self.console.close() # Closes the history file, if any
+        pygame.quit()
+        sys.exit()
     
     def handle_input(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                self.quit()
             
             # Fullscreen toggle with F11
             if event.type == pygame.KEYDOWN and event.key == pygame.K_F11:
@@ -1668,6 +2608,7 @@ class Game:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         self.state = "MENU"
+                        self.prepare_levels()
             elif self.state == "EDITING" or self.state == "RUNNING" or self.state == "FINISHED":
                 if self.state == "EDITING":
                     self.editor.handle_input(event)
@@ -1682,8 +2623,7 @@ class Game:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     if self.state == "MENU":
-                        pygame.quit()
-                        sys.exit()
+                        self.quit()
                     elif self.state != "GAME_OVER":
                         self.reset_run()
                 
@@ -1701,7 +2641,9 @@ class Game:
     
     def reset_run(self):
         self.state = "EDITING"
+        self.interpreter.stop()
         self.player.reset(self.map.start_pos)
+        self.preview_worker.cancel() # The tracker asks again on the next live update
         self.path_tracker.reset()
         self.coins = self.level_start_coins # Restore coins
         self.console.log("Reset. Coins Restored.", COLOR_TEXT)
@@ -1711,9 +2653,10 @@ class Game:
         if self.interpreter.run_code(code):
             self.state = "RUNNING"
             self.player.reset(self.map.start_pos)
+            self.preview_worker.cancel() # No preview while running
             self.path_tracker.reset()
             
-            lines_used = len([l for l in self.editor.lines if l.strip() and not l.strip().startswith('#')])
+            lines_used = count_code_lines(self.editor.lines)
             
             # Cost
             cost = lines_used * self.line_cost
@@ -1731,7 +2674,7 @@ class Game:
         if self.state == "EDITING" and current_time - self.last_live_update > self.live_update_interval:
             code = self.editor.get_text()
             if code.strip():  # Only simulate if there's code
-                self.path_tracker.simulate_code(code)
+                self.path_tracker.simulate_code(code, self.preview_worker)
             self.last_live_update = current_time
         
         # Update player animation
@@ -1742,17 +2685,13 @@ class Game:
             self.path_tracker.update_from_player((self.player.grid_x, self.player.grid_y))
         
         if self.state == "RUNNING" and not self.player.animating:
-            if self.interpreter.action_queue:
-                action = self.interpreter.action_queue.pop(0)
+            actions = self.interpreter.action_queue
+            if actions:
+                action = actions.popleft()
                 
-                # Check for consecutive moves
+                # Consecutive moves are stored as one run-length segment
                 if action[0] == 'MOVE':
-                    moves = 1
-                    # Peek ahead
-                    while self.interpreter.action_queue and self.interpreter.action_queue[0][0] == 'MOVE':
-                        self.interpreter.action_queue.pop(0)
-                        moves += 1
-                    
+                    moves = 1 + actions.pop_run(MOVE_ACTION)
                     self.execute_move_sequence(moves)
                 else:
                     self.execute_action(action)
@@ -1766,36 +2705,31 @@ class Game:
                     self.console.log("Stopped.", COLOR_TEXT)
     
     def execute_move_sequence(self, moves):
-        dx, dy = 0, 0
-        if self.player.direction == 0: dy = -1
-        elif self.player.direction == 1: dx = 1
-        elif self.player.direction == 2: dy = 1
-        elif self.player.direction == 3: dx = -1
+        dx, dy = DIRECTION_VECTORS[self.player.direction]
         
         # Check how far we can actually go
         valid_moves = 0
         crashed = False
         for i in range(1, moves + 1):
-            tx = self.player.grid_x + dx * i
-            ty = self.player.grid_y + dy * i
+            target = (self.player.grid_x + dx * i, self.player.grid_y + dy * i)
             # Check Key Pickup
-            if (tx, ty) in self.map.keys:
+            if self.map.cell_at(target) == CELL_KEY:
                 # Remove key
-                self.map.keys.remove((tx, ty))
+                self.map.remove_key(target)
                 self.player.keys_collected += 1
                 self.console.log("Key Collected!", COLOR_SUCCESS)
             # Check Door Collision
-            if (tx, ty) in self.map.doors:
+            if self.map.cell_at(target) == CELL_DOOR:
                 if self.player.keys_collected > 0:
                     # Unlock Door
-                    self.map.doors.remove((tx, ty))
+                    self.map.remove_door(target)
                     self.player.keys_collected -= 1
                     self.console.log("Door Unlocked!", COLOR_SUCCESS)
                 else:
                     crashed = True
                     self.console.log("CRASH: Door Locked!", COLOR_ERROR)
                     break
-            if self.map.is_wall(tx, ty):
+            if self.map.cell_at(target) == CELL_WALL:
                 crashed = True
                 break
             valid_moves += 1
@@ -1809,7 +2743,7 @@ class Game:
         
         if crashed:
             self.console.log(f"Path blocked! Moved {valid_moves}/{moves} steps.", COLOR_ERROR)
-            self.interpreter.action_queue = []
+            self.interpreter.stop()
     
     def execute_action(self, action):
         if action[0] == 'MOVE':
@@ -1859,13 +2793,15 @@ class Game:
         pygame.draw.line(self.screen, COLOR_GRID, (0, HUD_HEIGHT), (GAME_VIEW_WIDTH, HUD_HEIGHT), 2)
         
         # HUD Text
-        lines_used = len([l for l in self.editor.lines if l.strip() and not l.strip().startswith('#')])
+        lines_used = count_code_lines(self.editor.lines)
         goal_mult = 1.5 if self.difficulty == "HARD" else 2.0
         goal_lines = int(self.optimal_lines * goal_mult)
         
         # Compact HUD
         hud_font = self.font # Use smaller font
+        distance = self.map.distance_to_goal((self.player.grid_x, self.player.grid_y))
         hud_text = f"LVL: {self.level} | COINS: {self.coins} | LINES: {lines_used} (Cost: {lines_used*self.line_cost}) | GOAL: {goal_lines}"
+        if distance >= 0: hud_text += f" | DIST: {distance}"
         hud_surf = hud_font.render(hud_text, True, COLOR_HUD_TEXT)
         self.screen.blit(hud_surf, (20, 10))
         
@@ -1883,8 +2819,9 @@ class Game:
             self.screen.blit(surf, (GAME_VIEW_WIDTH//2 - surf.get_width()//2, SCREEN_HEIGHT//2))
         
         # Draw live tracking info
-        if self.state == "EDITING" and self.path_tracker.predicted_path:
-            predicted_length = len(self.path_tracker.predicted_path)
+        predicted_path = self.path_tracker.predicted_path
+        if self.state == "EDITING" and predicted_path:
+            predicted_length = len(predicted_path)
             info_text = f"Predicted Path: {predicted_length} steps"
             info_surf = self.font.render(info_text, True, COLOR_PATH_TRACK[:3])
             self.screen.blit(info_surf, (GAME_VIEW_WIDTH + 10, 10))
@@ -1933,5 +2870,16 @@ class Game:
             self.clock.tick(FPS)
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="MazeBot")
+    parser.add_argument("--seed", type=int, help="maze seed; everyone playing with the same seed gets the same levels")
+    parser.add_argument("--pack", help="level pack to take the seed's levels from (see levelpack.py)")
+    args = parser.parse_args()
+    if args.pack and args.seed is None:
+        parser.error("--pack needs a --seed to pick its levels")
+    pack = None
+    if args.pack:
+        sys.modules.setdefault('main', sys.modules[__name__]) # levelpack imports main: share this copy
+        import levelpack
+        pack = levelpack.LevelPack(args.pack)
+    game = Game(args.seed, pack)
     game.run()
@@ -0,0 +1,88 @@
+"""Streaming maze generation for very large grids.
+
+Usage: python mazegen.py SIZE [--seed N] [--output FILE]
+
+Mazes are laid out as in the game: passage cells sit at odd coordinates
+inside a size x size grid whose outer rows and columns are walls, and
+neighbouring cells are joined by opening the wall between them. Rows are
+bytes holding 0 for floor and 1 for wall, the game's CELL_FLOOR and
+CELL_WALL.
+
+eller_rows builds a perfect maze (exactly one path between any two cells)
+one row at a time with Eller's algorithm: only the set each cell of the
+current row belongs to is kept, so the working memory is O(size) however
+tall the maze is, and rows can go straight into a flat grid or a file.
+"""
+import argparse
+import random
+import sys
+
+FLOOR, WALL = 0, 1
+TEXT_TABLE = bytes.maketrans(bytes([FLOOR, WALL]), b".#")
+
+
+def eller_rows(size, rng=random):
+    """Yield the size rows of a random perfect maze, top to bottom"""
+    wall = bytes([WALL]) * size
+    columns = len(range(1, size - 1, 2))
+    cell_rows = len(range(1, size - 1, 2))
+    set_of = [0] * columns  # Set id of every cell in the current row, 0 for none yet
+    members = {}  # Set id -> its cells in the current row
+    next_set = 1
+    yield wall
+    for y in range(cell_rows):
+        last = y == cell_rows - 1
+        row = bytearray(wall)
+        row[1:2 * columns:2] = bytes(columns)
+        for i in range(columns):
+            if not set_of[i]:
+                set_of[i] = next_set
+                members[next_set] = [i]
+                next_set += 1
+        # Join neighbours in different sets on a coin flip; the last row joins them all
+        coins = rng.randbytes(columns)  # Coin flips drawn a row at a time: the low bit of each byte
+        for i in range(columns - 1):
+            a, b = set_of[i], set_of[i + 1]
+            if a != b and (last or coins[i] & 1):
+                row[2 * i + 2] = FLOOR
+                if len(members[a]) < len(members[b]):
+                    a, b = b, a
+                for column in members[b]:
+                    set_of[column] = a
+                members[a].extend(members.pop(b))
+        yield bytes(row)
+        if last:
+            break
+        # Every set goes on downwards through at least one of its cells
+        below = bytearray(wall)
+        set_of = [0] * columns
+        coins = rng.randbytes(columns)
+        for set_id, cells in members.items():
+            down = [column for column in cells if coins[column] & 1] or [rng.choice(cells)]
+            for column in down:
+                below[2 * column + 1] = FLOOR
+                set_of[column] = set_id
+            cells[:] = down
+        yield bytes(below)
+    for _ in range(size - 2 * cell_rows):
+        yield wall
+
+
+def write_text(file, rows):
+    """Write rows to a binary file, one line each, '#' for walls and '.' for floor"""
+    for row in rows:
+        file.write(row.translate(TEXT_TABLE) + b"\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("size", type=int)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the maze here instead of stdout")
+    args = parser.parse_args()
+    rows = eller_rows(args.size, random.Random(args.seed))
+    if args.output:
+        with open(args.output, "wb") as f:
+            write_text(f, rows)
+    else:
+        write_text(sys.stdout.buffer, rows)
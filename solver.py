@@ -0,0 +1,179 @@
+"""Fewest-lines programs from a start cell to a goal.
+
+Grids are flat and wall-padded as in gridsearch. The cost model is the one
+the game charges for: a quarter turn is one line (turn_left() or
+turn_right()), a single step is one line (move()) and a straight run of two
+or more steps is two lines (a for loop around move()).
+
+The search is a 0-1 BFS over (cell, facing, run, items) states, where run
+counts the steps taken since the last turn, capped at two (the first step of
+a run costs a line, the second upgrades move() to a loop for one more and
+every later step is free) and items is the bitmask of keys picked up and
+doors unlocked so far.
+
+Dead ends are pruned: walking into a blind corridor with nothing in it and
+back out costs a U-turn, two lines, while skipping it never costs more. So
+for every items mask, cells that only lead to dead ends are ranked in the
+order they fill up, and the robot may only walk out of them, from lower to
+higher rank. Picking up the last thing in a corridor turns it into a dead end
+for every later state, which stops the search from combing the parts of the
+maze already done over and over.
+"""
+from collections import deque
+from gridsearch import neighbor_steps, search
+
+TURN_LEFT, TURN_RIGHT, MOVE = "turn_left", "turn_right", "move"
+STATES = 12  # 4 facings x 3 run lengths per cell
+TURNS = (0, 3, 1, 2)  # Quarter turns before a step: none, left, right, around
+TURN_LINES = (0, 1, 2, 1)  # Lines for 0-3 quarter turns to the right
+
+
+def solve(walls, stride, start, facing, goal, keys=(), doors=()):
+    """Cheapest way from start (facing 0=N, 1=E, 2=S, 3=W) to goal
+
+    Stepping onto a key picks it up and stepping onto a locked door uses one
+    up; a locked door is never entered without a key, as the robot would
+    crash. Returns (lines, runs) with runs a list of (action, count) from
+    which program() writes the code, or None when the goal cannot be reached.
+    """
+    items = list(keys) + list(doors)
+    bits = {cell: 1 << i for i, cell in enumerate(items)}
+    key_bits = (1 << len(keys)) - 1
+    span = len(walls) * STATES  # States per items mask
+    steps = neighbor_steps(stride)
+    ranks = {0: fill_dead_ends([-1 if wall else 0 for wall in walls], stride, {goal, *items},
+                               [cell for cell, wall in enumerate(walls) if not wall])}
+    first = start * STATES + facing * 3
+    cost = {first: 0}
+    via = {}  # Previous state on the cheapest way here
+    done = set()
+    buckets = [[first], [], [], []]  # Dial's queue: states by cost modulo 4, as a step costs 0 to 3 lines
+    queued = 1
+    lines = 0
+    while queued:
+        bucket = buckets[lines & 3]
+        while bucket:
+            state = bucket.pop()
+            queued -= 1
+            if state in done or cost[state] < lines:
+                continue
+            done.add(state)
+            mask, rest = divmod(state, span)
+            cell, rest = divmod(rest, STATES)
+            if cell == goal:
+                return lines, runs(via, first, state)
+            facing, run = divmod(rest, 3)
+            rank = ranks[mask]
+            # A turn is only worth its line when a step follows, so both are one edge
+            for turn in TURNS:
+                heading = (facing + turn) & 3
+                ahead = cell + steps[heading]
+                if not (rank[ahead] == 0 or rank[ahead] > rank[cell] > 0):  # Live, or out of a dead end
+                    continue
+                moved = mask
+                bit = bits.get(ahead, 0)
+                if bit and not mask & bit:
+                    moved |= bit
+                    if bit > key_bits and bin(mask & key_bits).count("1") <= bin(mask >> len(keys)).count("1"):
+                        continue  # Locked door and no key
+                    if moved not in ranks:
+                        kept = {goal, *(item for item in items if not moved & bits[item])}
+                        ranks[moved] = fill_dead_ends(list(rank), stride, kept, [ahead])
+                if turn:
+                    target = moved * span + ahead * STATES + heading * 3 + 1
+                    total = lines + TURN_LINES[turn] + 1
+                else:  # The loop just runs once more from the third step on
+                    target = moved * span + ahead * STATES + heading * 3 + (2 if run else 1)
+                    total = lines if run == 2 else lines + 1
+                if target not in cost or total < cost[target]:
+                    cost[target] = total
+                    via[target] = state
+                    buckets[total & 3].append(target)
+                    queued += 1
+        lines += 1
+    return None
+
+
+def fill_dead_ends(rank, stride, keep, pending):
+    """Rank the dead ends reachable from the pending cells, cascading; returns rank
+
+    rank holds -1 for walls, 0 for live cells and the fill order for dead
+    ones. A live cell outside keep with at most one live neighbour is a dead
+    end and gets the next rank, which may make its neighbour one.
+    """
+    steps = neighbor_steps(stride)
+    filled = max(rank)
+    while pending:
+        cell = pending.pop()
+        if rank[cell] or cell in keep:
+            continue
+        live = [cell + step for step in steps if rank[cell + step] == 0]
+        if len(live) <= 1:
+            filled += 1
+            rank[cell] = filled
+            pending.extend(live)
+    return rank
+
+
+def runs(via, first, state):
+    """(action, count) runs along the via chain from first to state"""
+    actions = []
+    while state != first:
+        previous = via[state]
+        turn = (state // 3 - previous // 3) % 4  # Facings differ by this, cells by a multiple of 4
+        actions.append(MOVE)
+        actions.extend([TURN_LEFT] if turn == 3 else [TURN_RIGHT] * turn)
+        state = previous
+    actions.reverse()
+    result = []
+    for action in actions:
+        if result and result[-1][0] == action and action == MOVE:
+            result[-1] = (action, result[-1][1] + 1)
+        else:
+            result.append((action, 1))
+    return result
+
+
+def program(runs):
+    """Player code for runs, one line per turn or step and a loop for longer runs"""
+    lines = []
+    for action, count in runs:
+        if count == 1:
+            lines.append(f"{action}()")
+        else:
+            lines.extend([f"for i in range({count}):", f"    {action}()"])
+    return "\n".join(lines)
+
+
+def solvable(walls, stride, start, goal, keys=(), doors=()):
+    """Whether goal can be reached from start, picking up keys and unlocking doors on the way
+
+    The cells reachable from start only grow as doors open, so a state is
+    just (keys picked up, doors opened) and its region is one flood fill per
+    set of open doors, shared by every state with that set. Reachable keys
+    are always picked up, since holding more keys never hurts.
+    """
+    steps = neighbor_steps(stride)
+    regions = {}  # Opened-doors mask -> distance list of the flood from start
+    seen = set()
+    stack = [(0, 0)]
+    while stack:
+        picked, opened = stack.pop()
+        if (picked, opened) in seen:
+            continue
+        seen.add((picked, opened))
+        region = regions.get(opened)
+        if region is None:
+            closed = [door for i, door in enumerate(doors) if not opened >> i & 1]
+            region = regions[opened] = search(walls, stride, start, blocked=(closed,))[1]
+        if region[goal] >= 0:
+            return True
+        for i, key in enumerate(keys):
+            if region[key] >= 0:
+                picked |= 1 << i
+        if bin(picked).count("1") <= bin(opened).count("1"):
+            continue  # No key left to unlock anything
+        for i, door in enumerate(doors):
+            if not opened >> i & 1 and any(region[door + step] >= 0 for step in steps):
+                stack.append((picked, opened | 1 << i))
+    return False